@@ -25,8 +25,15 @@ bl_info = {
 }
 
 import os
+import re
 import bpy
+import json
+import time
+import hashlib
+import functools
+import numpy as np
 from collections import Counter
+from contextlib import contextmanager
 from bpy.props import (StringProperty,
                        BoolProperty,
                        IntProperty,
@@ -40,6 +47,7 @@ from bpy.types import (Menu,
                        Operator,
                        PropertyGroup,
                        )
+from bpy_extras.io_utils import ExportHelper
 
 # Scene Properties
 class SETKEY_Properties(PropertyGroup):
@@ -71,6 +79,11 @@ class SETKEY_Properties(PropertyGroup):
 		min = 3,
 		max = 100
 	)
+	procedural_blink : BoolProperty(
+		name="Procedural",
+		description="Key one blink and repeat it with a Cycles modifier, one sequence per material or object",
+		default = False
+	)
 	color_blink : FloatVectorProperty(
 		name="Color",
 		description="Color object blinks",
@@ -95,6 +108,14 @@ class SETKEY_Properties(PropertyGroup):
 		min = 5,
 		max = 50
 	)
+	pause_mode : EnumProperty(
+		name="Pause",
+		items= (
+			("IMAGE", "Image", "Add an image strip for each pause"),
+			("HOLD", "Hold", "Hold the first frame of each segment, no new strips")
+		),
+		default = "IMAGE"
+	)
 	move_cursor : BoolProperty(
 		name="Move Timeline Cursor",
 		description="Move Timeline Cursor to end new keyframe",
@@ -105,8 +126,498 @@ class SETKEY_Properties(PropertyGroup):
 		description="Make single user for materials",
 		default = True
 	)
+	effect_target : EnumProperty(
+		name="Keys On",
+		items= (
+			("MATERIAL", "Material", "Key group inputs in each material"),
+			("OBJECT", "Object", "Key a custom property on each object, materials stay shared")
+		),
+		default = "MATERIAL"
+	)
+	profiling : BoolProperty(
+		name="Profiling",
+		description="Record time and counts of SetKey operations",
+		default = False
+	)
+
+# Profiling
+PROFILE_EVENTS = 100000
+
+class Profiler:
+	def __init__(self):
+		self.active = 0
+		self.reset()
+
+	def reset(self):
+		self.origin = time.perf_counter()
+		self.timers = {}
+		self.counters = {}
+		self.events = []
+
+	def add(self, name, start, seconds):
+		timer = self.timers.setdefault(name, [0, 0.0])
+		timer[0] += 1
+		timer[1] += seconds
+		if len(self.events) < PROFILE_EVENTS:
+			self.events.append((name, start - self.origin, seconds))
+
+	def count(self, name, value=1):
+		if self.active:
+			self.counters[name] = self.counters.get(name, 0) + value
+
+	def as_dict(self):
+		return {
+			"timers": {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in self.timers.items()},
+			"counters": dict(self.counters),
+		}
+
+	def as_trace(self):
+		# Chrome trace format, opens in chrome://tracing or Perfetto
+		events = [{"name": name, "ph": "X", "ts": start * 1e6, "dur": seconds * 1e6, "pid": 0, "tid": 0}
+				for name, start, seconds in self.events]
+		if self.counters:
+			end = max((start + seconds for name, start, seconds in self.events), default=0.0)
+			events.append({"name": "Counters", "ph": "C", "ts": end * 1e6, "pid": 0, "tid": 0, "args": dict(self.counters)})
+		return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+profiler = Profiler()
+
+@contextmanager
+def profile(context, name):
+	# Phases are only recorded inside an operator run with profiling enabled
+	if not context.scene.property.profiling:
+		yield
+		return
+	profiler.active += 1
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		profiler.add(name, start, time.perf_counter() - start)
+		profiler.active -= 1
+
+def timed(name):
+	def decorator(function):
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			if not profiler.active:
+				return function(*args, **kwargs)
+			start = time.perf_counter()
+			try:
+				return function(*args, **kwargs)
+			finally:
+				profiler.add(name, start, time.perf_counter() - start)
+		return wrapper
+	return decorator
+
+class SETKEY_Profile_Export(Operator, ExportHelper):
+	bl_idname = "action.setkey_profile_export"
+	bl_label = "Export Profile"
+	bl_description = "Save SetKey timers and counters"
+
+	filename_ext = ".json"
+	filter_glob : StringProperty(default="*.json", options={"HIDDEN"})
+	format : EnumProperty(
+		name="Format",
+		items= (
+			("JSON", "JSON", "Timers and counters"),
+			("TRACE", "Chrome Trace", "Every timed phase, for chrome://tracing or Perfetto")
+		),
+		default = "JSON"
+	)
+
+	def execute(self, context):
+		with open(self.filepath, "w") as f:
+			json.dump(profiler.as_trace() if self.format == "TRACE" else profiler.as_dict(), f, indent=1)
+		self.report({"INFO"}, f"Saved profile to {self.filepath}")
+		return {"FINISHED"}
+
+class SETKEY_Profile_Reset(Operator):
+	bl_idname = "action.setkey_profile_reset"
+	bl_label = "Reset Profile"
+	bl_description = "Clear SetKey timers and counters"
+
+	def execute(self, context):
+		profiler.reset()
+		return {"FINISHED"}
+
+# Bulk edit
+bulk_edits = []
+
+class BulkEdit:
+	def __init__(self):
+		self.ids = {}
+		self.changed = 0
+		self.skipped = 0
+		self.edit_time = 0.0
+		self.update_time = 0.0
+
+def tag_edit(id_data):
+	if bulk_edits:
+		bulk_edits[-1].ids[id_data] = None
+
+def set_if_changed(data, property, value):
+	# Writing a material setting recompiles its shader even if the value is the same
+	if getattr(data, property) == value:
+		if bulk_edits:
+			bulk_edits[-1].skipped += 1
+		return False
+	setattr(data, property, value)
+	if bulk_edits:
+		bulk_edits[-1].changed += 1
+	tag_edit(data.id_data)
+	return True
+
+@contextmanager
+def bulk_edit(view_layer=None):
+	# Edited IDs are tagged once and updated together at the end, nested edits join the outer one
+	edit = BulkEdit()
+	bulk_edits.append(edit)
+	start = time.perf_counter()
+	try:
+		yield edit
+	finally:
+		bulk_edits.pop()
+		edit.edit_time = time.perf_counter() - start
+		if profiler.active:
+			profiler.add("Edit", start, edit.edit_time)
+		if bulk_edits:
+			bulk_edits[-1].ids.update(edit.ids)
+		else:
+			start = time.perf_counter()
+			for id_data in edit.ids:
+				id_data.update_tag()
+			if view_layer:
+				view_layer.update()
+			edit.update_time = time.perf_counter() - start
+			if profiler.active:
+				profiler.add("Update", start, edit.update_time)
+				profiler.count("Data-blocks updated", len(edit.ids))
+
+# Materials
+@timed("Resolve Materials")
+def resolve_materials(objects, single_user):
+	# Index all material slots of the selection once
+	slots = {}
+	for object in objects:
+		for id, slot in enumerate(object.material_slots):
+			material = slot.material
+			if material and material.use_nodes:
+				slots.setdefault(material, []).append((object, id))
+
+	# Materials also used outside the selection get a copy per slot
+	materials = {}
+	for material, users in slots.items():
+		if not (single_user and material.users > 1 and material.users != len(users)):
+			materials[material] = None
+			continue
+		owners = {}
+		for object, id in users:
+			slot = object.material_slots[id]
+			owners[(slot.link == "DATA" and object.data or object, id)] = slot
+		action = None
+		if material.node_tree.animation_data and material.node_tree.animation_data.action:
+			action = material.node_tree.animation_data.action
+		for slot in owners.values():
+			copy = material.copy()
+			if action:
+				copy.node_tree.animation_data.action = action.copy()
+			slot.material = copy
+			profiler.count("Materials copied")
+			tag_edit(slot.id_data)
+			materials[copy] = None
+	return list(materials)
+
+# Keyframes
+def blink_keys(frame, count, duration, blend):
+	# Value alternates between 0 and blend, starting and ending at 0
+	steps = np.arange(count * 2 + 1)
+	frames = frame + steps * duration
+	values = np.where(steps % 2 == 1, np.float32(max(min(1.0, blend), 0)), np.float32(0))
+	return frames, values
+
+def fade_keys(frame, toggle_type, duration):
+	# Show: 1 > 0, In/Out: 1 > 0 ... 0 > 1, Hide: 0 > 1
+	if toggle_type == "1":
+		steps, values = (0, 1), (1, 0)
+	elif toggle_type == "2":
+		steps, values = (0, 1, 4, 5), (1, 0, 0, 1)
+	else:
+		steps, values = (0, 1), (0, 1)
+	return frame + np.array(steps) * duration, np.array(values, dtype=np.float32)
+
+def enum_value(struct, property, name):
+	return struct.bl_rna.properties[property].enum_items[name].value
+
+def owned_action(id_data):
+	if id_data.animation_data is None:
+		id_data.animation_data_create()
+	action = id_data.animation_data.action
+	if action is None:
+		action = bpy.data.actions.new(id_data.name + "Action")
+		id_data.animation_data.action = action
+	elif action.users - action.use_fake_user > 1:
+		# Shared by 'Compact SetKey Animation', copied before it changes
+		action = action.copy()
+		id_data.animation_data.action = action
+	return action
+
+def pattern_spans(id_data, data_path):
+	# Frame spans of the patterns written to a channel, kept on the animated ID
+	key = hashlib.sha1(data_path.encode()).hexdigest()[:16]
+	spans = id_data.get("setkey_spans")
+	if spans is None or key not in spans:
+		return key, []
+	spans = list(spans[key])
+	return key, [(spans[index], spans[index + 1]) for index in range(0, len(spans), 2)]
+
+def store_spans(id_data, key, spans):
+	if "setkey_spans" not in id_data:
+		id_data["setkey_spans"] = {}
+	if spans:
+		id_data["setkey_spans"][key] = [float(frame) for span in spans for frame in span]
+	elif key in id_data["setkey_spans"]:
+		del id_data["setkey_spans"][key]
+
+@timed("Write Keyframes")
+def write_keyframes(data, property, frames, values, span=None):
+	# Same curves as 'keyframe_insert' per frame, written in one go per channel
+	# 'property' may also be a custom property path like '["name"]', 'span' is
+	# the range the pattern covers when it is longer than its keys
+	id_data = data.id_data
+	data_path = data.path_from_id(property)
+	action = owned_action(id_data)
+	tag_edit(id_data)
+	values = np.asarray(values, dtype=np.float32).reshape(len(frames), -1)
+	frames = np.asarray(frames, dtype=np.float32)
+	preferences = bpy.context.preferences.edit
+	interpolation = enum_value(bpy.types.Keyframe, "interpolation", preferences.keyframe_new_interpolation_type)
+	handle = enum_value(bpy.types.Keyframe, "handle_left_type", preferences.keyframe_new_handle_type)
+
+	# Earlier patterns overlapping this one are replaced, keys outside them are never touched
+	span = (float(frames[0]), float(frames[-1])) if span is None else span
+	key, spans = pattern_spans(id_data, data_path)
+	replaced = replaced_spans(spans, *span)
+	store_spans(id_data, key, [old for old in spans if old not in replaced] + [span])
+	changed = 0
+	for index in range(values.shape[1]):
+		fcurve = action.fcurves.find(data_path, index=index)
+		if fcurve is None:
+			fcurve = action.fcurves.new(data_path, index=index)
+		points = fcurve.keyframe_points
+		if len(points):
+			changed += diff_keyframes(points, frames, values[:, index], replaced)
+		else:
+			co = np.stack((frames, values[:, index]), axis=1)
+			points.add(len(frames))
+			points.foreach_set("co", co.ravel())
+			# Handles one frame either side, as 'keyframe_insert' does, for FREE / ALIGNED handle types
+			points.foreach_set("handle_left", (co - (1, 0)).ravel())
+			points.foreach_set("handle_right", (co + (1, 0)).ravel())
+			for property_name, default in (("interpolation", interpolation), ("handle_left_type", handle), ("handle_right_type", handle)):
+				points.foreach_set(property_name, np.full(len(points), default, dtype=np.int32))
+			changed += len(frames)
+		fcurve.update()
+	profiler.count("Keyframes written", changed)
+	return changed
+
+def diff_keyframes(points, frames, values, replaced):
+	# Only keys that differ from the new pattern are touched
+	co = np.empty(len(points) * 2, dtype=np.float32)
+	points.foreach_get("co", co)
+	co = co.reshape(-1, 2)
+	keyed = co[:, 0]
+	found = np.minimum(np.searchsorted(keyed, frames), len(keyed) - 1)
+	exists = keyed[found] == frames
+
+	# Stale keys: left by a replaced pattern and not part of the new one
+	in_replaced = np.zeros(len(keyed), dtype=bool)
+	for start, end in replaced:
+		in_replaced |= (keyed >= start) & (keyed <= end)
+	stale = np.flatnonzero(in_replaced & ~np.isin(keyed, frames))
+
+	update = np.flatnonzero(exists & (co[found, 1] != values))
+	for key in update:
+		# Handles move with the key, as when 'keyframe_insert' replaces it
+		point = points[int(found[key])]
+		offset = values[key] - point.co.y
+		point.co.y = values[key]
+		point.handle_left.y += offset
+		point.handle_right.y += offset
+
+	# Removing keeps the points sorted, so missing keys can be inserted after
+	for point_index in stale[::-1]:
+		points.remove(points[int(point_index)], fast=True)
+	missing = np.flatnonzero(~exists)
+	for key in missing:
+		points.insert(frames[key], values[key], options={"FAST"})
+	return len(update) + len(stale) + len(missing)
+
+def replaced_spans(spans, start, end):
+	return [span for span in spans if span[0] <= end and span[1] >= start]
+
+def find_fcurve(data, property):
+	id_data = data.id_data
+	if id_data.animation_data is None or id_data.animation_data.action is None:
+		return None
+	return id_data.animation_data.action.fcurves.find(data.path_from_id(property))
+
+def read_keys(fcurve):
+	co = np.empty(len(fcurve.keyframe_points) * 2, dtype=np.float32)
+	fcurve.keyframe_points.foreach_get("co", co)
+	return co.reshape(-1, 2)
+
+def can_cycle(data, property, start, end):
+	# A Cycles modifier repeats every key of the curve, so all of them have
+	# to belong to patterns the new one replaces
+	fcurve = find_fcurve(data, property)
+	if fcurve is None:
+		return True
+	keyed = read_keys(fcurve)[:, 0]
+	covered = np.zeros(len(keyed), dtype=bool)
+	for span_start, span_end in replaced_spans(pattern_spans(data.id_data, fcurve.data_path)[1], start, end):
+		covered |= (keyed >= span_start) & (keyed <= span_end)
+	return bool(covered.all())
+
+def expand_cycles(data, property, start, end):
+	# A procedural blink outside the new pattern is kept as explicit keys
+	fcurve = find_fcurve(data, property)
+	modifiers = [modifier for modifier in fcurve.modifiers if modifier.type == "CYCLES"] if fcurve else []
+	if not modifiers or not len(fcurve.keyframe_points):
+		return
+	repeat = modifiers[0].cycles_after
+	co = read_keys(fcurve)
+	set_cycles(data, property, 0)
+	period = co[-1, 0] - co[0, 0]
+	if co[0, 0] <= end and co[-1, 0] + period * repeat >= start:
+		return
+	frames = np.concatenate([co[:-1, 0] + period * cycle for cycle in range(repeat + 1)] + [co[-1:, 0] + period * repeat])
+	values = np.concatenate([co[:-1, 1]] * (repeat + 1) + [co[-1:, 1]])
+	write_keyframes(data, property, frames, values)
+
+def set_cycles(data, property, repeat):
+	# Keyed period is played 'repeat' more times, then holds the last key
+	id_data = data.id_data
+	data_path = data.path_from_id(property)
+	for fcurve in id_data.animation_data.action.fcurves:
+		if fcurve.data_path != data_path:
+			continue
+		for modifier in [modifier for modifier in fcurve.modifiers if modifier.type == "CYCLES"]:
+			fcurve.modifiers.remove(modifier)
+		if repeat > 0:
+			modifier = fcurve.modifiers.new("CYCLES")
+			modifier.mode_before = "NONE"
+			modifier.mode_after = "REPEAT"
+			modifier.cycles_after = repeat
+
+# Effect groups
+EFFECT_VERSION = 1
+
+def effect_signature(group):
+	return str(sorted((item.in_out, item.socket_type, item.name) for item in group.interface.items_tree if item.item_type == "SOCKET"))
+
+def find_effect_group(effect):
+	for group in bpy.data.node_groups:
+		if group.get("setkey_effect") == effect and group.get("setkey_version") == EFFECT_VERSION:
+			if group.get("setkey_signature") == effect_signature(group):
+				return group
+	return None
+
+def get_effect_group(effect):
+	# One group per effect shared by all materials, materials only differ by group node inputs
+	group = find_effect_group(effect)
+	if group is None:
+		group = EFFECTS[effect]()
+		profiler.count("Groups created")
+		group["setkey_effect"] = effect
+		group["setkey_version"] = EFFECT_VERSION
+		group["setkey_signature"] = effect_signature(group)
+	return group
+
+def merge_effect_groups(effect):
+	# Point all duplicate "SetKey_*" groups with the same sockets to one of them,
+	# the shared group when it exists, without creating any group
+	prefix = "SetKey_" + effect
+	shared = find_effect_group(effect)
+	candidates = {}
+	for group in sorted(bpy.data.node_groups, key=lambda group: (group != shared, group.name)):
+		if group.name.startswith(prefix) and group.get("setkey_effect") in (None, effect):
+			candidates.setdefault(effect_signature(group), []).append(group)
+	merged = 0
+	for group, *duplicates in candidates.values():
+		for duplicate in duplicates:
+			duplicate.user_remap(group)
+			bpy.data.node_groups.remove(duplicate)
+		merged += len(duplicates)
+	return merged
+
+def find_group_node(material_nodes, effect):
+	for node in material_nodes:
+		if node.type == "GROUP" and node.node_tree:
+			tag = node.node_tree.get("setkey_effect")
+			if tag == effect or (tag is None and "SetKey_" + effect in node.node_tree.name):
+				return node
+	return None
+
+def use_object_attributes(group, sockets):
+	# Group inputs replaced by Attribute nodes reading the object (or its instancer)
+	group_input = next(node for node in group.nodes if node.type == "GROUP_INPUT")
+	for offset, (name, (attribute, output)) in enumerate(sockets.items()):
+		targets = [link.to_socket for link in group.links if link.from_socket == group_input.outputs[name]]
+		attribute_node = group.nodes.new("ShaderNodeAttribute")
+		attribute_node.attribute_type = "INSTANCER"
+		attribute_node.attribute_name = attribute
+		attribute_node.location = (0, -200 - offset * 200)
+		for target in targets:
+			group.links.new(attribute_node.outputs[output], target)
+		group.interface.remove(group.interface.items_tree[name])
+	return group
+
+def object_property(object, name, default, subtype="NONE"):
+	if name not in object:
+		object[name] = default
+		object.id_properties_ui(name).update(min=0.0, max=1.0, subtype=subtype)
+
+def keyed_objects(objects):
+	return [object for object in objects if any(slot.material and slot.material.use_nodes for slot in object.material_slots)]
 
 # Blink
+def build_blink_group():
+	# Create nodes (input \ output) in group
+	group = bpy.data.node_groups.new("SetKey_Blink", "ShaderNodeTree")
+	group_input : bpy.types.ShaderNodeGroup = group.nodes.new("NodeGroupInput")
+	group_input.location = (0, 0)
+	group_output : bpy.types.ShaderNodeGroup = group.nodes.new("NodeGroupOutput")
+	group_output.location = (900, 0)
+	
+	mix_shader = group.nodes.new("ShaderNodeMixShader")
+	mix_shader.location = (600,100)
+	
+	diffuse_shader = group.nodes.new("ShaderNodeBsdfDiffuse")
+	diffuse_shader.location = (300, -100)
+	
+	group.interface.new_socket(name="Shader", description="Shader Input", in_out ="INPUT", socket_type="NodeSocketShader")
+	group.interface.new_socket(name="Color", description="Color Input", in_out ="INPUT", socket_type="NodeSocketColor")
+	group.interface.new_socket(name="Value", description="Color float factor", in_out ="INPUT", socket_type="NodeSocketFloat")
+	group.interface.new_socket(name="Shader", description="Shader Output", in_out ="OUTPUT", socket_type="NodeSocketShader")
+	
+	group.interface.items_tree[2].default_value = (1, 0, 0, 1)
+	group.interface.items_tree[3].default_value = 0
+	group.interface.items_tree[3].min_value  = 0
+	group.interface.items_tree[3].max_value  = 1
+
+	group.links.new(diffuse_shader.outputs[0], mix_shader.inputs[2])
+	group.links.new(group_input.outputs[0], mix_shader.inputs[1])
+	group.links.new(group_input.outputs[1], diffuse_shader.inputs[0])
+	group.links.new(group_input.outputs[2], mix_shader.inputs[0])
+	group.links.new(mix_shader.outputs[0], group_output.inputs[0])
+	return group
+
+def build_blink_object_group():
+	group = build_blink_group()
+	group.name = "SetKey_Blink_Object"
+	return use_object_attributes(group, {"Color": ("setkey_blink_color", "Color"), "Value": ("setkey_blink", "Fac")})
+
 class SETKEY_Blink(Operator):
 	bl_idname = "action.setkey_blink"
 	bl_label = "Set Key Blink"
@@ -114,284 +625,446 @@ class SETKEY_Blink(Operator):
 	bl_options = {"REGISTER", "UNDO"}
 
 	def execute(self, context):
-		# Get materials
-		materials = []
-		for object in bpy.context.selected_objects:
-			for id, slot in enumerate(object.material_slots):
-				material = object.material_slots[id].material
-				if material and material.use_nodes:
-					if context.scene.property.single_user and material.users > 1:
-						# Get all materials selected object
-						all_materials = []
-						for obj in bpy.context.selected_objects:
-							for mat in obj.material_slots:
-								all_materials.append(mat.name)
-						# Make single user
-						if material.users != all_materials.count(material.name):
-							material = material.copy()
-							if material.node_tree.animation_data and material.node_tree.animation_data.action:
-								material.node_tree.animation_data.action = material.node_tree.animation_data.action.copy()
-							object.material_slots[id].material = material
-					# Add material to list
-					if not material in materials:
-						materials.append(material)
-				else: continue
-		
-		# Set key for available materials
-		for material in materials:
-			material_nodes = material.node_tree.nodes
-			links = material.node_tree.links
-
-			# Check available OUTPUT_MATERIAL
-			material_output = None
-			for node in material_nodes:
-				if node.type == "OUTPUT_MATERIAL":
-					material_output = node
-					break
-			if material_output is None:
-				material_output = material_nodes.new("ShaderNodeOutputMaterial")
-
-			# Check available group
-			group_node = None
-			groups = [node for node in material_nodes if node.type == "GROUP"]
-			for group in groups:
-				if "SetKey_Blink" in group.node_tree.name:
-					group_node = group
-					self.set_key(context, group_node)
-					break
-			if group_node is None:
-				group_node = self.create_group(context, material_output, material_nodes, links)
-				self.set_key(context, group_node)
+		with profile(context, self.bl_label):
+			property = context.scene.property
+			params = (bpy.context.scene.frame_current, property.count_blink, property.duration_blink, property.blend_blink, property.color_blink, property.procedural_blink)
+
+			# Object mode keys one property per object, materials stay shared
+			with bulk_edit(context.view_layer) as edit:
+				if property.effect_target == "OBJECT":
+					explicit = apply_blink_objects(bpy.context.selected_objects, *params)
+				else:
+					explicit = apply_blink(resolve_materials(bpy.context.selected_objects, property.single_user), *params)
+			if explicit:
+				self.report({"WARNING"}, f"{explicit} curves have other blinks, keyed without Cycles")
+			report_edit(self, edit)
 		
-		# Set frame cursor in timeline
-		if context.scene.property.move_cursor:
-			curent_frame = bpy.context.scene.frame_current
-			context.scene.frame_set(curent_frame + (context.scene.property.duration_blink * (context.scene.property.count_blink * 2)))
+			# Set frame cursor in timeline
+			if context.scene.property.move_cursor:
+				curent_frame = bpy.context.scene.frame_current
+				context.scene.frame_set(curent_frame + (context.scene.property.duration_blink * (context.scene.property.count_blink * 2)))
 		
-		return {"FINISHED"}
+			return {"FINISHED"}
 
-	def create_group(self, context, material_output, material_nodes, links):
-		# Create nodes (input \ output) in group
-		group = bpy.data.node_groups.new("SetKey_Blink", "ShaderNodeTree")
-		group_input : bpy.types.ShaderNodeGroup = group.nodes.new("NodeGroupInput")
-		group_input.location = (0, 0)
-		group_output : bpy.types.ShaderNodeGroup = group.nodes.new("NodeGroupOutput")
-		group_output.location = (900, 0)
-		
-		mix_shader = group.nodes.new("ShaderNodeMixShader")
-		mix_shader.location = (600,100)
-		
-		diffuse_shader = group.nodes.new("ShaderNodeBsdfDiffuse")
-		diffuse_shader.location = (300, -100)
-		
-		group.interface.new_socket(name="Shader", description="Shader Input", in_out ="INPUT", socket_type="NodeSocketShader")
-		group.interface.new_socket(name="Color", description="Color Input", in_out ="INPUT", socket_type="NodeSocketColor")
-		group.interface.new_socket(name="Value", description="Color float factor", in_out ="INPUT", socket_type="NodeSocketFloat")
-		group.interface.new_socket(name="Shader", description="Shader Output", in_out ="OUTPUT", socket_type="NodeSocketShader")
-		
-		group.interface.items_tree[2].default_value = (1, 0, 0, 1)
-		group.interface.items_tree[3].default_value = 0
-		group.interface.items_tree[3].min_value  = 0
-		group.interface.items_tree[3].max_value  = 1
-
-		group.links.new(diffuse_shader.outputs[0], mix_shader.inputs[2])
-		group.links.new(group_input.outputs[0], mix_shader.inputs[1])
-		group.links.new(group_input.outputs[1], diffuse_shader.inputs[0])
-		group.links.new(group_input.outputs[2], mix_shader.inputs[0])
-		group.links.new(mix_shader.outputs[0], group_output.inputs[0])
-		
-		# Create group node
-		group_node = material_nodes.new("ShaderNodeGroup")
-		group_node.node_tree = group
-		group_node.location = material_output.location
-		material_output.location.x = material_output.location.x + 300
-		
-		if material_output.inputs["Surface"].links:
-			links.new(material_output.inputs["Surface"].links[0].from_node.outputs[0], group_node.inputs[0])
-			links.new(group_node.outputs["Shader"], material_output.inputs["Surface"])
-		else:
-			links.new(group_node.outputs["Shader"], material_output.inputs["Surface"])
-		return group_node
+# Transparent
+def build_transparent_group():
+	# Create nodes (input \ output) in group
+	group = bpy.data.node_groups.new("SetKey_Transparent", "ShaderNodeTree")
+	group_input : bpy.types.ShaderNodeGroup = group.nodes.new("NodeGroupInput")
+	group_input.location = (0, 0)
+	group_output : bpy.types.ShaderNodeGroup = group.nodes.new("NodeGroupOutput")
+	group_output.location = (900, 0)
+	
+	mix_shader = group.nodes.new("ShaderNodeMixShader")
+	mix_shader.location = (600,100)
+	
+	transparent_shader = group.nodes.new("ShaderNodeBsdfTransparent")
+	transparent_shader.location = (300, -100)
+	transparent_shader.inputs["Color"].default_value = (1, 1, 1, 0)
 
-	def set_key(self, context, group_node):
-		curent_frame = bpy.context.scene.frame_current
-		value = group_node.inputs[2]
-		value.default_value = 0
-		color = group_node.inputs["Color"]
-		color.default_value = context.scene.property.color_blink
-		
-		for i in range((context.scene.property.count_blink * 2) + 1):
-			value.keyframe_insert("default_value", frame = curent_frame)
-			color.keyframe_insert("default_value", frame = curent_frame)
-			curent_frame = curent_frame + context.scene.property.duration_blink
-			value.default_value = not value.default_value
-			value.default_value = max(min(value.default_value, context.scene.property.blend_blink), 0)
-		return {"FINISHED"}
+	group.interface.new_socket(name="Shader", description="Shader Input", in_out ="INPUT", socket_type="NodeSocketShader")
+	group.interface.new_socket(name="Value", description="Transparency float factor", in_out ="INPUT", socket_type="NodeSocketFloat")
+	group.interface.new_socket(name="Shader", description="Shader Output", in_out ="OUTPUT", socket_type="NodeSocketShader")
+
+	group.interface.items_tree[2].default_value = 0
+	group.interface.items_tree[2].min_value  = 0
+	group.interface.items_tree[2].max_value  = 1
+
+	group.links.new(transparent_shader.outputs[0], mix_shader.inputs[2])
+	group.links.new(group_input.outputs[0], mix_shader.inputs[1])
+	group.links.new(group_input.outputs[1], mix_shader.inputs[0])
+	group.links.new(mix_shader.outputs[0], group_output.inputs[0])
+	return group
+
+def build_transparent_object_group():
+	group = build_transparent_group()
+	group.name = "SetKey_Transparent_Object"
+	return use_object_attributes(group, {"Value": ("setkey_transparent", "Fac")})
 
-# Transparent
 class SETKEY_Transparent(Operator):
 	bl_idname = "action.setkey_transparent"
 	bl_label = "Set Key Transparent"
 	bl_description = "Auto set key for transparency"
 	bl_options = {"REGISTER", "UNDO"}
 
+	# Fixed by the Show / In/Out / Hide variants, otherwise taken from the scene
+	toggle_type = None
+
 	def execute(self, context):
-		# Get Materials
-		materials = []
-		for object in bpy.context.selected_objects:
-			for id, slot in enumerate(object.material_slots):
-				material = object.material_slots[id].material
-				if material and material.use_nodes:
-					if context.scene.property.single_user and material.users > 1:
-						# Get all materials selected object
-						all_materials = []
-						for obj in bpy.context.selected_objects:
-							for mat in obj.material_slots:
-								all_materials.append(mat.name)
-						# Make single user
-						if material.users != all_materials.count(material.name):
-							material = material.copy()
-							if material.node_tree.animation_data and material.node_tree.animation_data.action:
-								material.node_tree.animation_data.action = material.node_tree.animation_data.action.copy()
-							object.material_slots[id].material = material
-					# Add material to list
-					if not material in materials:
-						materials.append(material)
-				else: continue
+		with profile(context, self.bl_label):
+			property = context.scene.property
+			toggle_type = self.toggle_type or property.toggle_type
+			params = (bpy.context.scene.frame_current, toggle_type, property.duration_fade)
+
+			# Object mode keys one property per object, materials stay shared
+			with bulk_edit(context.view_layer) as edit:
+				if property.effect_target == "OBJECT":
+					apply_fade_objects(bpy.context.selected_objects, *params)
+				else:
+					apply_fade(resolve_materials(bpy.context.selected_objects, property.single_user), *params)
+			report_edit(self, edit)
 		
-		# Set key for available materials
-		for material in materials:
-			material_nodes = material.node_tree.nodes
-			links = material.node_tree.links
+			# Set frame cursor in timeline
+			if context.scene.property.move_cursor:
+				curent_frame = bpy.context.scene.frame_current
+				if toggle_type == "2":
+					context.scene.frame_set(curent_frame + (context.scene.property.duration_fade * 5))
+				else:
+					context.scene.frame_set(curent_frame + context.scene.property.duration_fade )
 			
-			# Material parameters
-			material.blend_method = "HASHED"
-			material.use_backface_culling = True
-
-			# Check available OUTPUT_MATERIAL
-			material_output = None
-			for node in material_nodes:
-				if node.type == "OUTPUT_MATERIAL":
-					material_output = node
-					break
-			if material_output is None:
-				material_output = material_nodes.new("ShaderNodeOutputMaterial")
-			
-			# Check available group
-			group_node = None
-			groups = [node for node in material_nodes if node.type == "GROUP"]
-			for group in groups:
-				if "SetKey_Transparent" in group.node_tree.name:
-					group_node = group
-					self.set_key(context, group_node)
-					break
-			if group_node is None:
-				group_node = self.create_group(context, material_output, material_nodes, links)
-				self.set_key(context, group_node)
-		
-		# Set frame cursor in timeline
-		if context.scene.property.move_cursor:
-			curent_frame = bpy.context.scene.frame_current
-			if context.scene.property.toggle_type == "2":
-				context.scene.frame_set(curent_frame + (context.scene.property.duration_fade * 5))
-			else:
-				context.scene.frame_set(curent_frame + context.scene.property.duration_fade )
-			
-		return {"FINISHED"}
-	
-	def create_group(self, context, material_output, material_nodes, links):
-		# Create nodes (input \ output) in group
-		group = bpy.data.node_groups.new("SetKey_Transparent", "ShaderNodeTree")
-		group_input : bpy.types.ShaderNodeGroup = group.nodes.new("NodeGroupInput")
-		group_input.location = (0, 0)
-		group_output : bpy.types.ShaderNodeGroup = group.nodes.new("NodeGroupOutput")
-		group_output.location = (900, 0)
-		
-		mix_shader = group.nodes.new("ShaderNodeMixShader")
-		mix_shader.location = (600,100)
-		
-		transparent_shader = group.nodes.new("ShaderNodeBsdfTransparent")
-		transparent_shader.location = (300, -100)
-		transparent_shader.inputs["Color"].default_value = (1, 1, 1, 0)
+			return {"FINISHED"}
 
-		group.interface.new_socket(name="Shader", description="Shader Input", in_out ="INPUT", socket_type="NodeSocketShader")
-		group.interface.new_socket(name="Value", description="Transparency float factor", in_out ="INPUT", socket_type="NodeSocketFloat")
-		group.interface.new_socket(name="Shader", description="Shader Output", in_out ="OUTPUT", socket_type="NodeSocketShader")
+class SETKEY_Transparent_Hide(SETKEY_Transparent):
+	bl_idname = "action.setkey_transparent_hide"
+	bl_label = "Transparent Hide"
+	bl_options = {"REGISTER", "UNDO"}
+	toggle_type = "3"
+
+class SETKEY_Transparent_InOut(SETKEY_Transparent):
+	bl_idname = "action.setkey_transparent_inout"
+	bl_label = "Transparent In/Out"
+	bl_options = {"REGISTER", "UNDO"}
+	toggle_type = "2"
 
-		group.interface.items_tree[2].default_value = 0
-		group.interface.items_tree[2].min_value  = 0
-		group.interface.items_tree[2].max_value  = 1
+class SETKEY_Transparent_Show(SETKEY_Transparent):
+	bl_idname = "action.setkey_transparent_show"
+	bl_label = "Transparent Show"
+	bl_options = {"REGISTER", "UNDO"}
+	toggle_type = "1"
 
-		group.links.new(transparent_shader.outputs[0], mix_shader.inputs[2])
-		group.links.new(group_input.outputs[0], mix_shader.inputs[1])
-		group.links.new(group_input.outputs[1], mix_shader.inputs[0])
-		group.links.new(mix_shader.outputs[0], group_output.inputs[0])
+EFFECTS = {
+	"Blink": build_blink_group,
+	"Transparent": build_transparent_group,
+	"Blink_Object": build_blink_object_group,
+	"Transparent_Object": build_transparent_object_group,
+}
 
-		# Create group node
+# Keying
+def report_edit(operator, edit):
+	operator.report({"INFO"}, f"Edited {len(edit.ids)} data-blocks in {edit.edit_time:.3f} s, update {edit.update_time:.3f} s")
+
+@timed("Group Nodes")
+def effect_group_node(material, effect):
+	# Group node of the effect, created in front of the material output if missing
+	material_nodes = material.node_tree.nodes
+	links = material.node_tree.links
+	material_output = None
+	for node in material_nodes:
+		if node.type == "OUTPUT_MATERIAL":
+			material_output = node
+			break
+	if material_output is None:
+		material_output = material_nodes.new("ShaderNodeOutputMaterial")
+
+	group_node = find_group_node(material_nodes, effect)
+	if group_node is None:
 		group_node = material_nodes.new("ShaderNodeGroup")
-		group_node.node_tree = group
+		group_node.node_tree = get_effect_group(effect)
+		profiler.count("Group nodes created")
 		group_node.location = material_output.location
 		material_output.location.x = material_output.location.x + 300
-
 		if material_output.inputs["Surface"].links:
 			links.new(material_output.inputs["Surface"].links[0].from_node.outputs[0], group_node.inputs[0])
-			links.new(group_node.outputs["Shader"], material_output.inputs["Surface"])
+		links.new(group_node.outputs["Shader"], material_output.inputs["Surface"])
+		tag_edit(material)
+	return group_node
+
+def effect_materials(objects):
+	materials = {}
+	for object in objects:
+		for slot in object.material_slots:
+			if slot.material and slot.material.use_nodes:
+				materials[slot.material] = None
+	return list(materials)
+
+def key_blink(value, value_path, color, color_path, color_value, frame, count, duration, blend, procedural):
+	# Returns the last value and whether a procedural blink had to be keyed explicitly
+	color_value = np.array(color_value, dtype=np.float32)
+	span = (float(frame), float(frame + count * duration * 2))
+	cycles = procedural and can_cycle(value, value_path, *span)
+	if cycles:
+		# One period of keys, a Cycles modifier repeats it 'count' times
+		frames, values = blink_keys(frame, 1, duration, blend)
+		write_keyframes(value, value_path, frames, values, span)
+		write_keyframes(color, color_path, frames[:1], color_value[np.newaxis], span)
+		set_cycles(value, value_path, count - 1)
+	else:
+		frames, values = blink_keys(frame, count, duration, blend)
+		expand_cycles(value, value_path, *span)
+		write_keyframes(value, value_path, frames, values)
+		write_keyframes(color, color_path, frames, np.tile(color_value, (len(frames), 1)))
+	return float(values[-1]), procedural and not cycles
+
+def apply_blink(materials, frame, count, duration, blend, color, procedural=False):
+	# Returns the number of procedural blinks keyed explicitly
+	explicit = 0
+	for material in materials:
+		group_node = effect_group_node(material, "Blink")
+		value = group_node.inputs[2]
+		color_socket = group_node.inputs["Color"]
+		color_socket.default_value = color
+		value.default_value, fallback = key_blink(value, "default_value", color_socket, "default_value", color, frame, count, duration, blend, procedural)
+		explicit += fallback
+	return explicit
+
+def apply_blink_objects(objects, frame, count, duration, blend, color, procedural=False):
+	# Materials stay shared, each object keys its own properties
+	for material in effect_materials(objects):
+		effect_group_node(material, "Blink_Object")
+	color = tuple(color)
+	explicit = 0
+	for object in keyed_objects(objects):
+		object_property(object, "setkey_blink", 0.0)
+		object_property(object, "setkey_blink_color", color, "COLOR")
+		object["setkey_blink_color"] = color
+		object["setkey_blink"], fallback = key_blink(object, '["setkey_blink"]', object, '["setkey_blink_color"]', color, frame, count, duration, blend, procedural)
+		explicit += fallback
+	return explicit
+
+def apply_fade(materials, frame, toggle_type, duration):
+	frames, values = fade_keys(frame, toggle_type, duration)
+	for material in materials:
+		set_if_changed(material, "blend_method", "HASHED")
+		set_if_changed(material, "use_backface_culling", True)
+		value = effect_group_node(material, "Transparent").inputs[1]
+		write_keyframes(value, "default_value", frames, values)
+		value.default_value = values[-1]
+
+def apply_fade_objects(objects, frame, toggle_type, duration):
+	frames, values = fade_keys(frame, toggle_type, duration)
+	for material in effect_materials(objects):
+		set_if_changed(material, "blend_method", "HASHED")
+		set_if_changed(material, "use_backface_culling", True)
+		effect_group_node(material, "Transparent_Object")
+	for object in keyed_objects(objects):
+		object_property(object, "setkey_transparent", 0.0)
+		write_keyframes(object, '["setkey_transparent"]', frames, values)
+		object["setkey_transparent"] = float(values[-1])
+
+# Scheduler
+SCHEDULE_EFFECTS = {"BLINK": None, "SHOW": "1", "INOUT": "2", "HIDE": "3"}
+
+def scene_event(scene, objects, effect, frame, **params):
+	# Parameters not given are taken from the scene settings
+	property = scene.property
+	event = {"objects": list(objects), "effect": effect, "frame": frame}
+	if effect == "BLINK":
+		event.update(count=property.count_blink, duration=property.duration_blink, blend=property.blend_blink,
+				color=tuple(property.color_blink), procedural=property.procedural_blink)
+	else:
+		event.update(duration=property.duration_fade)
+	event.update(params)
+	return event
+
+def marker_events(scene, objects):
+	# Markers named BLINK, SHOW, INOUT or HIDE
+	markers = sorted(scene.timeline_markers, key=lambda marker: marker.frame)
+	return [scene_event(scene, objects, marker.name, marker.frame) for marker in markers if marker.name in SCHEDULE_EFFECTS]
+
+def event_length(event):
+	if event["effect"] == "BLINK":
+		return event["count"] * event["duration"] * 2
+	return event["duration"] * (5 if event["effect"] == "INOUT" else 1)
+
+def event_overlaps(events):
+	# Blinks, and fades, of one object must not overlap
+	overlaps = []
+	last = {}
+	for event in sorted(events, key=lambda event: event["frame"]):
+		end = event["frame"] + event_length(event)
+		for object in event["objects"]:
+			channel = (object, event["effect"] == "BLINK")
+			if channel in last and last[channel][0] > event["frame"]:
+				overlaps.append((object, last[channel][1], event))
+			if channel not in last or last[channel][0] < end:
+				last[channel] = (end, event)
+	return overlaps
+
+def procedural_conflicts(events, target="MATERIAL"):
+	# A Cycles modifier repeats the whole curve, so a procedural blink must be the only blink of its object or material
+	channels = {}
+	for event in events:
+		if event["effect"] == "BLINK":
+			for channel in event["objects"] if target == "OBJECT" else effect_materials(event["objects"]):
+				channels.setdefault(channel, []).append(event)
+	conflicts = {}
+	for blinks in channels.values():
+		if len(blinks) > 1:
+			conflicts.update((id(event), event) for event in blinks if event["procedural"])
+	return list(conflicts.values())
+
+@timed("Schedule Events")
+def schedule_events(events, target="MATERIAL", single_user=True):
+	# All events keyed in one pass without changing the current frame
+	if target != "OBJECT":
+		resolve_materials(list(dict.fromkeys(object for event in events for object in event["objects"])), single_user)
+	# Conflicting procedural blinks are keyed explicitly instead
+	explicit = [id(event) for event in procedural_conflicts(events, target)]
+	for event in events:
+		objects = event["objects"]
+		if event["effect"] == "BLINK":
+			procedural = event["procedural"] and id(event) not in explicit
+			params = (event["frame"], event["count"], event["duration"], event["blend"], event["color"], procedural)
+			if target == "OBJECT":
+				apply_blink_objects(objects, *params)
+			else:
+				apply_blink(effect_materials(objects), *params)
 		else:
-			links.new(group_node.outputs["Shader"], material_output.inputs["Surface"])
-		return group_node
-
-	def set_key(self, context, group_node):
-		curent_frame = bpy.context.scene.frame_current
-		value = group_node.inputs[1]
-		
-		if context.scene.property.toggle_type == "1":
-			value.default_value = 1
-			range_value = 2
-		elif context.scene.property.toggle_type == "2":
-			value.default_value = 1
-			range_value = 4
-		elif context.scene.property.toggle_type == "3":
-			value.default_value = 0
-			range_value = 2
-			
-		for i in range(range_value):
-			if i == 2:
-				curent_frame += context.scene.property.duration_fade * 2
-				value.default_value = 0
-			value.keyframe_insert("default_value", frame = curent_frame)
-			curent_frame += context.scene.property.duration_fade
-			value.default_value = not value.default_value
-		return {"FINISHED"}
+			params = (event["frame"], SCHEDULE_EFFECTS[event["effect"]], event["duration"])
+			if target == "OBJECT":
+				apply_fade_objects(objects, *params)
+			else:
+				apply_fade(effect_materials(objects), *params)
+	return len(events)
 
-class SETKEY_Transparent_Hide(SETKEY_Transparent):
-	bl_idname = "action.setkey_transparent_hide"
-	bl_label = "Transparent Hide"
+class SETKEY_Schedule(Operator):
+	bl_idname = "action.setkey_schedule"
+	bl_label = "Set Keys From Markers"
+	bl_description = "Key selected objects at markers named BLINK, SHOW, INOUT or HIDE"
 	bl_options = {"REGISTER", "UNDO"}
 
 	def execute(self, context):
-		context.scene.property.toggle_type = "3"
-		SETKEY_Transparent.execute(self, context)
-		return {'FINISHED'}
-
-class SETKEY_Transparent_InOut(SETKEY_Transparent):
-	bl_idname = "action.setkey_transparent_inout"
-	bl_label = "Transparent In/Out"
+		with profile(context, self.bl_label):
+			events = marker_events(context.scene, bpy.context.selected_objects)
+			overlaps = event_overlaps(events)
+			for object, previous, event in overlaps:
+				self.report({"ERROR"}, f"{object.name}: {event['effect']} at {event['frame']} overlaps {previous['effect']} at {previous['frame']}")
+			if overlaps:
+				return {"CANCELLED"}
+			for event in procedural_conflicts(events, context.scene.property.effect_target):
+				self.report({"WARNING"}, f"BLINK at {event['frame']} shares its curve with other blinks, keyed without Cycles")
+			with bulk_edit(context.view_layer) as edit:
+				keyed = schedule_events(events, context.scene.property.effect_target, context.scene.property.single_user)
+			self.report({"INFO"}, f"Keyed {keyed} events")
+			report_edit(self, edit)
+			return {"FINISHED"}
+
+class SETKEY_Cleanup_Groups(Operator):
+	bl_idname = "action.setkey_cleanup_groups"
+	bl_label = "Merge Duplicate Groups"
+	bl_description = "Replace duplicate SetKey groups with one shared group per effect"
 	bl_options = {"REGISTER", "UNDO"}
 
 	def execute(self, context):
-		context.scene.property.toggle_type = "2"
-		SETKEY_Transparent.execute(self, context)
-		return {'FINISHED'}
+		merged = 0
+		for effect in EFFECTS:
+			merged += merge_effect_groups(effect)
+		self.report({"INFO"}, f"Merged {merged} duplicate groups")
+		return {"FINISHED"}
 
-class SETKEY_Transparent_Show(SETKEY_Transparent):
-	bl_idname = "action.setkey_transparent_show"
-	bl_label = "Transparent Show"
+# Compact
+def setkey_fcurves(id_data):
+	# F-curves driving SetKey group inputs or SetKey object properties
+	if id_data.animation_data is None or id_data.animation_data.action is None:
+		return []
+	fcurves = []
+	for fcurve in id_data.animation_data.action.fcurves:
+		if fcurve.data_path.startswith('["setkey_'):
+			fcurves.append(fcurve)
+			continue
+		match = re.match(r'nodes\["(.+?)"\]\.inputs', fcurve.data_path)
+		node = match and hasattr(id_data, "nodes") and id_data.nodes.get(match.group(1))
+		if node and node.type == "GROUP" and node.node_tree and node.node_tree.name.startswith("SetKey_"):
+			fcurves.append(fcurve)
+	return fcurves
+
+def compact_fcurve(fcurve, tolerance):
+	# Keys overwritten by a key on the same frame and keys inside flat runs
+	points = fcurve.keyframe_points
+	if len(points) < 3 or len(fcurve.modifiers):
+		return 0
+	co = np.empty(len(points) * 2, dtype=np.float32)
+	points.foreach_get("co", co)
+	frames, values = co[0::2], co[1::2]
+	duplicate = np.append(frames[:-1] == frames[1:], False)
+	kept = np.flatnonzero(~duplicate)
+	kept_values = values[kept]
+	flat = np.zeros(len(kept), dtype=bool)
+	flat[1:-1] = (np.abs(kept_values[1:-1] - kept_values[:-2]) <= tolerance) & (np.abs(kept_values[1:-1] - kept_values[2:]) <= tolerance)
+	redundant = np.union1d(np.flatnonzero(duplicate), kept[flat])
+	for index in redundant[::-1]:
+		points.remove(points[int(index)], fast=True)
+	if len(redundant):
+		fcurve.update()
+	return len(redundant)
+
+def rna_values(struct):
+	# Every RNA property of a modifier, including collections like envelope control points
+	values = []
+	for property in struct.bl_rna.properties:
+		if property.identifier in ("rna_type", "active", "show_expanded") or property.type == "POINTER":
+			continue
+		value = getattr(struct, property.identifier)
+		if property.type == "COLLECTION":
+			value = [rna_values(item) for item in value]
+		elif getattr(property, "is_array", False):
+			value = tuple(value)
+		values.append((property.identifier, value))
+	return values
+
+def action_hash(action):
+	digest = hashlib.sha1()
+	for fcurve in sorted(action.fcurves, key=lambda fcurve: (fcurve.data_path, fcurve.array_index)):
+		points = fcurve.keyframe_points
+		modifiers = [rna_values(modifier) for modifier in fcurve.modifiers]
+		group = fcurve.group.name if fcurve.group else None
+		digest.update(f"{fcurve.data_path}[{fcurve.array_index}]{fcurve.extrapolation}{fcurve.mute}{group}{modifiers}".encode())
+		for property_name, dtype, size in (("co", np.float32, 2), ("handle_left", np.float32, 2), ("handle_right", np.float32, 2),
+				("interpolation", np.int32, 1), ("handle_left_type", np.int32, 1), ("handle_right_type", np.int32, 1),
+				("easing", np.int32, 1), ("back", np.float32, 1), ("amplitude", np.float32, 1), ("period", np.float32, 1),
+				("type", np.int32, 1)):
+			array = np.empty(len(points) * size, dtype=dtype)
+			points.foreach_get(property_name, array)
+			digest.update(array.tobytes())
+	return digest.hexdigest()
+
+def merge_actions(owners):
+	# Owners with identical actions share the first one, the others are removed.
+	# Only actions made of SetKey curves alone are merged, never the user's own animation
+	shared = {}
+	removed = 0
+	for owner in owners:
+		action = owner.animation_data.action
+		if len(setkey_fcurves(owner)) != len(action.fcurves):
+			continue
+		key = action_hash(action)
+		if key not in shared:
+			shared[key] = action
+		elif shared[key] != action:
+			owner.animation_data.action = shared[key]
+			if action.users == 0:
+				bpy.data.actions.remove(action)
+				removed += 1
+	return removed
+
+class SETKEY_Compact(Operator):
+	bl_idname = "action.setkey_compact"
+	bl_label = "Compact SetKey Animation"
+	bl_description = "Remove redundant SetKey keys and share identical actions"
 	bl_options = {"REGISTER", "UNDO"}
 
+	tolerance : FloatProperty(
+		name="Tolerance",
+		description="Largest value difference treated as constant",
+		default = 0.0001,
+		min = 0,
+		precision = 5
+	)
+
 	def execute(self, context):
-		context.scene.property.toggle_type = "1"
-		SETKEY_Transparent.execute(self, context)
-		return {'FINISHED'}
+		with profile(context, self.bl_label):
+			owners = [material.node_tree for material in bpy.data.materials if material.node_tree] + list(bpy.data.objects)
+			keys = 0
+			animated = []
+			for owner in owners:
+				fcurves = setkey_fcurves(owner)
+				for fcurve in fcurves:
+					keys += compact_fcurve(fcurve, self.tolerance)
+				if fcurves:
+					animated.append(owner)
+			actions = merge_actions(animated)
+			self.report({"INFO"}, f"Removed {keys} keys and {actions} actions")
+			return {"FINISHED"}
 
 # Pause
 class SETKEY_Marker(Operator):
@@ -405,6 +1078,102 @@ class SETKEY_Marker(Operator):
 		context.scene.timeline_markers.new('P', frame=curent_frame)
 		return {'FINISHED'}
 
+# Pause files
+PAUSE_FILE = "pauses.json"
+PAUSE_LEGACY_FILE = "pauses.txt"
+PAUSE_VERSION = 2
+
+def scene_fps(scene):
+	return scene.render.fps / scene.render.fps_base
+
+def pause_markers(scene):
+	# "P" uses the pause duration of the scene, "P:<frames>" its own
+	pauses = {}
+	for marker in scene.timeline_markers:
+		name, _, duration = marker.name.partition(":")
+		if name != "P" or (duration and not duration.isdigit()):
+			continue
+		if duration or marker.frame not in pauses:
+			pauses[marker.frame] = int(duration) if duration else None
+	return sorted(pauses.items())
+
+def sequence_fingerprint(directory, count, first, last):
+	# Directory name only, so the same render matches from any platform path
+	return [os.path.basename(os.path.normpath(directory)), count, first, last]
+
+def render_fingerprint(scene):
+	# The image sequence the scene renders
+	first = scene.render.frame_path(frame=scene.frame_start)
+	last = scene.render.frame_path(frame=scene.frame_end)
+	return sequence_fingerprint(os.path.dirname(first), scene.frame_end - scene.frame_start + 1, os.path.basename(first), os.path.basename(last))
+
+def strip_fingerprint(strip, directory):
+	elements = strip.elements
+	return sequence_fingerprint(directory, len(elements), elements[0].filename, elements[-1].filename)
+
+def pause_checksum(shot):
+	payload = [shot["fps"], shot["frame_offset"], shot["frame_range"], shot["pauses"]]
+	if "sequence" in shot:
+		payload.append(shot["sequence"])
+	return hashlib.sha1(json.dumps(payload).encode()).hexdigest()
+
+def read_pause_file(directory):
+	path = os.path.join(directory, PAUSE_FILE)
+	if not os.path.exists(path):
+		return {"version": PAUSE_VERSION, "shots": {}}
+	with open(path) as f:
+		data = json.load(f)
+	profiler.count("Files read")
+	if data.get("version", 0) > PAUSE_VERSION:
+		raise ValueError(f"{path} was written by a newer version")
+	return data
+
+def save_pauses(directory, name, scene):
+	# Shots of other scenes in the same file are kept, the file is replaced atomically
+	data = read_pause_file(directory)
+	shot = {
+		"fps": scene_fps(scene),
+		"frame_offset": scene.frame_start,
+		"frame_range": [scene.frame_start, scene.frame_end],
+		"pauses": pause_markers(scene),
+		"sequence": render_fingerprint(scene),
+	}
+	shot["checksum"] = pause_checksum(shot)
+	data["shots"][name] = shot
+	os.makedirs(directory, exist_ok=True)
+	path = os.path.join(directory, PAUSE_FILE)
+	with open(path + ".tmp", "w") as f:
+		json.dump(data, f, indent=1)
+	os.replace(path + ".tmp", path)
+	return shot
+
+@timed("Read Pauses")
+def load_pauses(directory, name, fps, sequence=None):
+	# Pauses relative to the first rendered frame, in frames of 'fps'
+	if not os.path.exists(os.path.join(directory, PAUSE_FILE)):
+		path = os.path.join(directory, PAUSE_LEGACY_FILE)
+		if not os.path.exists(path):
+			return []
+		with open(path) as f:
+			profiler.count("Files read")
+			return [(int(marker), None) for marker in f.read().split() if marker.isdigit()]
+
+	shots = read_pause_file(directory)["shots"]
+	if name not in shots and len(shots) != 1:
+		raise ValueError(f"No shot '{name}' in {PAUSE_FILE}: " + ", ".join(shots))
+	shot = shots[name] if name in shots else next(iter(shots.values()))
+	if shot.get("checksum") != pause_checksum(shot):
+		raise ValueError(f"Checksum mismatch in {PAUSE_FILE}")
+	# Version 1 files have no sequence to compare
+	if sequence and "sequence" in shot and shot["sequence"] != sequence:
+		raise ValueError(f"Pauses were saved for sequence {shot['sequence']}, the strip is {sequence}")
+	scale = fps / shot["fps"]
+	pauses = []
+	for frame, duration in shot["pauses"]:
+		frame = round((frame - shot["frame_offset"]) * scale)
+		pauses.append((frame, None if duration is None else max(round(duration * scale), 1)))
+	return pauses
+
 class SETKEY_Marker_Save(Operator):
 	bl_idname = "action.setkey_marker_save"
 	bl_label = "Save Marker"
@@ -412,33 +1181,32 @@ class SETKEY_Marker_Save(Operator):
 	bl_options = {"REGISTER", "UNDO"}
 
 	def execute(self, context):
-		markers = self.get_markers(context)
-		self.save_markers(context, markers)
+		directory = os.path.dirname(bpy.path.abspath(context.scene.render.filepath))
+		try:
+			shot = save_pauses(directory, context.scene.name, context.scene)
+		except (OSError, ValueError) as error:
+			self.report({"ERROR"}, str(error))
+			return {"CANCELLED"}
+		self.report({"INFO"}, f"Saved {len(shot['pauses'])} pauses to {os.path.join(directory, PAUSE_FILE)}")
 		return {'FINISHED'}
 
-	def get_markers(self, context):
-		markers = []
-		for marker in bpy.context.scene.timeline_markers:
-			if marker.name == "P" and marker.frame not in markers:
-				markers.extend([marker.frame])
-		markers = sorted(markers)
-		return markers
-	
-	def save_markers(self, context, markers):
-		output_path = bpy.context.scene.render.filepath
-		abs_output_path = bpy.path.abspath(output_path)
-		
-		if abs_output_path[-1] != '\\':
-			abs_output_path = abs_output_path.rpartition('\\')[0] 
-			abs_output_path = abs_output_path + "\\"
-		
-		dir_check = os.path.dirname(abs_output_path)
-		os.makedirs(dir_check, exist_ok=True)
-		
-		with open(abs_output_path + "pauses.txt", "w") as f:
-			for marker in markers:
-				f.write(f"{marker} ")
-		return {'FINISHED'}
+@timed("Plan Pauses")
+def plan_pauses(markers, active_strip, duration_pause):
+	# One pass over sorted markers: cut in the original strip, start and length of the hold, held image
+	start_frame = active_strip.frame_final_start
+	length = active_strip.frame_final_duration
+	plan = []
+	shift = 0
+	for marker, duration in sorted(dict(markers).items()):
+		if not 0 <= marker <= length:
+			continue
+		duration = duration or duration_pause
+		cut = start_frame + marker
+		# Pause on the last frame holds the last image
+		image = active_strip.strip_elem_from_frame(min(cut, active_strip.frame_final_end - 1)).filename
+		plan.append((cut, cut + shift, duration, image))
+		shift += duration
+	return plan
 
 class SETKEY_Pause(Operator):
 	bl_idname = "action.setkey_pause"
@@ -446,54 +1214,100 @@ class SETKEY_Pause(Operator):
 	bl_description = "Create pause on selected sequence"
 	bl_options = {"REGISTER", "UNDO"}
 
-	def execute(self, context):
-		active_strip = bpy.context.scene.sequence_editor.active_strip
-		if len(bpy.context.selected_sequences) == 1 and active_strip.type == "IMAGE":
-			active_strip_path = bpy.path.abspath(active_strip.directory)
-			markers = self.get_markers(context, active_strip_path)
-			if markers:
-				self.create_pause(context, markers, active_strip, active_strip_path)
-		return {"FINISHED"}
+	dry_run : BoolProperty(
+		name="Dry Run",
+		description="Only report the planned cuts and holds",
+		default = False
+	)
 
-	def get_markers(self, context, active_strip_path):
-		markers = []
-		pause_file = active_strip_path + "pauses.txt"
-		if os.path.exists(pause_file):
-			with open(pause_file) as f:
-				for marker in f.readline().split():
-					if marker.isdigit():
-						markers.append(int(marker))
-			return markers
-
-	def create_pause(self, context, markers, active_strip, active_strip_path):
-		step = 0
+	def execute(self, context):
+		with profile(context, self.bl_label):
+			active_strip = bpy.context.scene.sequence_editor.active_strip
+			if len(bpy.context.selected_sequences) == 1 and active_strip.type == "IMAGE":
+				active_strip_path = bpy.path.abspath(active_strip.directory)
+				try:
+					markers = self.get_markers(context, active_strip, active_strip_path)
+				except (OSError, ValueError) as error:
+					self.report({"ERROR"}, str(error))
+					return {"CANCELLED"}
+				if markers:
+					plan = plan_pauses(markers, active_strip, context.scene.property.duration_pause)
+					if self.dry_run:
+						self.report_plan(context, plan)
+					elif plan:
+						self.create_pause(context, plan, active_strip, active_strip_path)
+			return {"FINISHED"}
+
+	def get_markers(self, context, active_strip, active_strip_path):
+		return load_pauses(active_strip_path, context.scene.name, scene_fps(context.scene), strip_fingerprint(active_strip, active_strip_path))
+
+	def report_plan(self, context, plan):
+		for cut, hold, duration, image in plan:
+			self.report({"INFO"}, f"Cut {cut}, hold {hold}-{hold + duration - 1}: {image}")
+		self.report({"INFO"}, f"Planned {len(plan)} pauses, {sum(pause[2] for pause in plan)} frames")
+
+	@timed("Create Pause")
+	def create_pause(self, context, plan, active_strip, active_strip_path):
 		start_frame = active_strip.frame_final_start
-		active_strip_length = active_strip.frame_final_end
-		duration_pause = context.scene.property.duration_pause
-		for marker in markers:
-			end_strip = bpy.context.selected_sequences[-1]
-			marker_offset = marker + start_frame + step # '-set_start_frame' if start not 0 frame			
-			if marker_offset in range(end_strip.frame_final_start, end_strip.frame_final_end + 1):
-				next_strip = end_strip.split(marker_offset, "SOFT")
-				if next_strip is None:
-					next_strip = end_strip
-
-				# Set next strip
-				next_strip.frame_start += duration_pause
-				if marker == markers[-1] and marker_offset == end_strip.frame_final_end - duration_pause:
-					next_strip.frame_start -= duration_pause
-
-				# Add images to sequence
-				sequence_image = next_strip.strip_elem_from_frame(marker_offset + duration_pause).filename
-				image = active_strip_path + sequence_image
-				sequences = bpy.context.scene.sequence_editor.sequences
-				image_strip = sequences.new_image("Image", image, active_strip.channel, marker_offset)
+		end_frame = active_strip.frame_final_end
+		hold_mode = context.scene.property.pause_mode == "HOLD"
+
+		# Split right to left, each segment moves by the pauses before it
+		segments = []
+		strip = active_strip
+		for cut, hold, duration, image in reversed(plan):
+			if start_frame < cut < end_frame:
+				segments.append((strip.split(cut, "HARD" if hold_mode else "SOFT"), hold + duration - cut, duration))
+				profiler.count("Strips split")
+		cut, hold, duration, image = plan[0]
+		still = None
+		if hold_mode and cut == start_frame and strip.frame_final_start > strip.frame_start:
+			# Pulling the left handle would show trimmed source frames,
+			# the first image is held by the right handle of a one frame segment instead
+			if strip.frame_final_end > start_frame + 1:
+				segments.append((strip.split(start_frame + 1, "HARD"), duration, 0))
+				profiler.count("Strips split")
+			segments.append((strip, 0, 0))
+			still = strip
+		else:
+			segments.append((strip, duration, duration) if cut == start_frame else (strip, 0, 0))
+
+		# Last segment first, so moved segments never overlap
+		for segment, shift, duration in segments:
+			if shift:
+				segment.frame_start += shift
+
+		if hold_mode:
+			# Hard cut segments start with their own first image,
+			# the left handle is pulled over the pause to hold it
+			for segment, shift, duration in segments:
+				if duration:
+					segment.frame_final_start -= duration
+			if still:
+				still.frame_final_end += plan[0][2]
+			if plan[-1][0] == end_frame:
+				last = segments[0][0]
+				if last.frame_final_end < last.frame_start + last.frame_duration:
+					# Trimmed source frames after the end: the last image moves past the pause
+					# on its own hard cut segment and is held by its left handle
+					if last.frame_final_duration > 1:
+						last = last.split(last.frame_final_end - 1, "HARD")
+						profiler.count("Strips split")
+					last.frame_start += plan[-1][2]
+					last.frame_final_start -= plan[-1][2]
+				else:
+					last.frame_final_end += plan[-1][2]
+		else:
+			# Add images to sequence
+			sequences = bpy.context.scene.sequence_editor.sequences
+			for cut, hold, duration, image in plan:
+				image_strip = sequences.new_image("Image", os.path.join(active_strip_path, image), active_strip.channel, hold)
 				image_strip.select = False
-				image_strip.frame_final_duration = duration_pause
+				image_strip.frame_final_duration = duration
 				image_strip.color_tag = "COLOR_05"
-				
-				step += context.scene.property.duration_pause
-		bpy.context.scene.frame_end = active_strip_length + step - 1
+				profiler.count("Strips added")
+
+		bpy.context.scene.frame_end = end_frame + sum(pause[2] for pause in plan) - 1
 		bpy.context.scene.frame_start = start_frame
 		return {'FINISHED'}
 
@@ -527,6 +1341,7 @@ class SETKEY_PT_subpanel_1(SETKEY_panel, Panel):
 		col.prop(context.scene.property, "blend_blink")
 		col.prop(context.scene.property, "duration_blink")
 		col.prop(context.scene.property, "count_blink")
+		col.prop(context.scene.property, "procedural_blink")
 		col.separator()
 		row = col.row()
 		row.label(text="Set Keys:")
@@ -578,6 +1393,34 @@ class SETKEY_PT_subpanel_4(SETKEY_panel, Panel):
 		col.alignment = "LEFT"
 		col.prop(context.scene.property, "move_cursor")
 		col.prop(context.scene.property, "single_user")
+		row = col.row()
+		row.prop(context.scene.property, "effect_target", expand=True)
+		col.operator(SETKEY_Cleanup_Groups.bl_idname, icon="NODETREE")
+		col.operator(SETKEY_Compact.bl_idname, icon="ACTION")
+
+class SETKEY_PT_subpanel_5(SETKEY_panel, Panel):
+	bl_parent_id = "SETKEY_PT_panel"
+	bl_label = "Profiling"
+
+	def draw_header(self, context):
+		self.layout.prop(context.scene.property, "profiling", text="")
+
+	def draw(self, context):
+		layout = self.layout
+		col = layout.column(align=True)
+		for name, (calls, seconds) in profiler.timers.items():
+			row = col.row()
+			row.label(text=name)
+			row.label(text=f"{calls} x {seconds * 1000:.1f} ms")
+		for name, value in profiler.counters.items():
+			row = col.row()
+			row.label(text=name)
+			row.label(text=str(value))
+		if not profiler.timers:
+			col.label(text="No data")
+		row = layout.row()
+		row.operator(SETKEY_Profile_Export.bl_idname, icon="EXPORT")
+		row.operator(SETKEY_Profile_Reset.bl_idname, text="", icon="X")
 
 # Draw UI Context Menu
 class SETKEY_MT_menu(Menu):
@@ -605,6 +1448,8 @@ class SETKEY_MT_submenu(Menu):
 		layout.operator(SETKEY_Transparent_InOut.bl_idname, icon="SMOOTHCURVE")
 		layout.operator(SETKEY_Transparent_Hide.bl_idname, icon="HIDE_ON")
 		layout.separator()
+		layout.operator(SETKEY_Schedule.bl_idname, icon="MARKER")
+		layout.separator()
 		layout.operator(SETKEY_Marker.bl_idname, icon="MARKER_HLT")
 
 # Draw UI in Sequencer
@@ -633,6 +1478,8 @@ class SETKEY_PT_subpanel_se_1(SETKEY_panel_se, Panel):
 		layout = self.layout
 		col = layout.column(align=True)
 		col.prop(context.scene.property, "duration_pause")
+		row = col.row()
+		row.prop(context.scene.property, "pause_mode", expand=True)
 		col = layout.column()
 		row = col.row()
 		row.label(text="Create Pauses:")
@@ -646,14 +1493,20 @@ classes = (
 	SETKEY_Transparent_InOut,
 	SETKEY_Transparent_Hide,
 	SETKEY_Transparent,
+	SETKEY_Schedule,
+	SETKEY_Cleanup_Groups,
+	SETKEY_Compact,
 	SETKEY_Marker_Save,
 	SETKEY_Marker,
 	SETKEY_Pause,
+	SETKEY_Profile_Export,
+	SETKEY_Profile_Reset,
 	SETKEY_PT_panel,
 	SETKEY_PT_subpanel_1,
 	SETKEY_PT_subpanel_2,
 	SETKEY_PT_subpanel_3,
 	SETKEY_PT_subpanel_4,
+	SETKEY_PT_subpanel_5,
 	SETKEY_MT_menu,
 	SETKEY_MT_submenu,
 	SETKEY_PT_panel_se,
@@ -0,0 +1,169 @@
+# Auto SetKey command line
+# Copyright (C) 2024 VGmove
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# One shot inside Blender:
+# blender -b shot.blend --python auto_setkey_cli.py -- --shot job.json [--result result.json]
+#
+# Many shots in parallel:
+# python auto_setkey_cli.py --jobs episode.json --workers 8 --blender blender --log-dir logs/
+#
+# Shot spec:
+# {"blend": "sh010.blend", "save": true, "actions": [
+#     {"type": "blink", "objects": ["Cube"], "frame": 10, "count": 2, "duration": 12, "blend": 0.9, "color": [1, 0, 0, 1]},
+#     {"type": "inout", "objects": ["Cube"], "frame": 60, "duration": 12},
+#     {"type": "pause", "scene": "Edit", "strip": "render", "duration": 24, "mode": "HOLD"}]}
+# Jobs file: {"shots": [<shot spec>, ...]}, blend paths relative to the jobs file
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+	import bpy
+except ImportError:
+	bpy = None
+
+# Action type: scheduler effect, or operator for pauses
+EFFECTS = {"blink": "BLINK", "show": "SHOW", "inout": "INOUT", "hide": "HIDE"}
+PARAMETERS = ("count", "duration", "blend", "color", "procedural")
+PAUSE_PARAMETERS = {"duration": "duration_pause", "mode": "pause_mode"}
+
+# Inside Blender
+def register_addon():
+	sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+	import Auto_SetKey as addon
+	try:
+		addon.register()
+	except ValueError:
+		pass
+	return addon
+
+def run_action(addon, action):
+	scene = bpy.data.scenes[action["scene"]] if "scene" in action else bpy.context.scene
+
+	if action["type"] == "pause":
+		for key, name in PAUSE_PARAMETERS.items():
+			if key in action:
+				setattr(scene.property, name, action[key])
+		editor = scene.sequence_editor
+		strip = editor.sequences_all[action["strip"]]
+		editor.active_strip = strip
+		with bpy.context.temp_override(scene=scene, selected_sequences=[strip]):
+			return bpy.ops.action.setkey_pause()
+
+	# Blink and fades go straight to the keying API, no operator or frame change
+	objects = [bpy.data.objects[name] for name in action.get("objects", [])]
+	params = {key: action[key] for key in PARAMETERS if key in action}
+	event = addon.scene_event(scene, objects, EFFECTS[action["type"]], action.get("frame", scene.frame_current), **params)
+	with addon.bulk_edit(bpy.context.view_layer) as edit:
+		addon.schedule_events([event], action.get("target", scene.property.effect_target), action.get("single_user", scene.property.single_user))
+	print("edit %.3f s, update %.3f s" % (edit.edit_time, edit.update_time))
+	return {"FINISHED"}
+
+def run_shot(spec, result_file):
+	addon = register_addon()
+	records = []
+	for action in spec["actions"]:
+		start = time.perf_counter()
+		result = run_action(addon, action)
+		records.append({"type": action["type"], "seconds": time.perf_counter() - start, "result": sorted(result)})
+		print("%-8s %9.3f s %s" % (action["type"], records[-1]["seconds"], records[-1]["result"]))
+	if spec.get("save", True):
+		bpy.ops.wm.save_mainfile()
+	if result_file:
+		with open(result_file, "w") as f:
+			json.dump({"blend": bpy.data.filepath, "actions": records}, f, indent=2)
+
+# Dispatcher
+def shot_name(index, shot):
+	return "%04d_%s" % (index, os.path.splitext(os.path.basename(shot["blend"]))[0])
+
+def run_blender(index, shot, args):
+	name = shot_name(index, shot)
+	spec_file = os.path.join(args.log_dir, name + ".job.json")
+	result_file = os.path.join(args.log_dir, name + ".result.json")
+	log_file = os.path.join(args.log_dir, name + ".log")
+	with open(spec_file, "w") as f:
+		json.dump(shot, f, indent=2)
+	command = [args.blender, "-b", shot["blend"], "--python-exit-code", "1", "--python", os.path.abspath(__file__),
+			"--", "--shot", spec_file, "--result", result_file]
+
+	start = time.perf_counter()
+	with open(log_file, "w") as f:
+		returncode = subprocess.call(command, stdout=f, stderr=subprocess.STDOUT)
+	record = {
+		"blend": shot["blend"],
+		"returncode": returncode,
+		"seconds": time.perf_counter() - start,
+		"log": log_file,
+		"actions": None,
+	}
+	if os.path.exists(result_file):
+		with open(result_file) as f:
+			record["actions"] = json.load(f)["actions"]
+	print("%-40s %9.3f s exit %d" % (os.path.basename(shot["blend"]), record["seconds"], returncode))
+	return record
+
+def dispatch(args):
+	with open(args.jobs) as f:
+		jobs = json.load(f)
+	shots = jobs["shots"] if isinstance(jobs, dict) else jobs
+	root = os.path.dirname(os.path.abspath(args.jobs))
+	for shot in shots:
+		shot["blend"] = os.path.join(root, shot["blend"])
+	os.makedirs(args.log_dir, exist_ok=True)
+
+	start = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=args.workers) as pool:
+		records = list(pool.map(lambda item: run_blender(item[0], item[1], args), enumerate(shots)))
+	summary = {
+		"workers": args.workers,
+		"seconds": time.perf_counter() - start,
+		"failed": sum(record["returncode"] != 0 for record in records),
+		"shots": records,
+	}
+	with open(os.path.join(args.log_dir, "summary.json"), "w") as f:
+		json.dump(summary, f, indent=2)
+	return summary["failed"] == 0
+
+def main():
+	argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+	parser = argparse.ArgumentParser(description="Run Auto SetKey operators from job specs")
+	parser.add_argument("--shot", default="", help="Shot spec to run inside Blender")
+	parser.add_argument("--result", default="", help="Result file of the shot")
+	parser.add_argument("--jobs", default="", help="Jobs file to dispatch")
+	parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+	parser.add_argument("--blender", default="blender", help="Blender executable")
+	parser.add_argument("--log-dir", default="setkey_logs")
+	args = parser.parse_args(argv)
+
+	if args.shot:
+		if bpy is None:
+			parser.error("--shot has to run inside Blender")
+		with open(args.shot) as f:
+			run_shot(json.load(f), args.result)
+	elif args.jobs:
+		if not dispatch(args):
+			sys.exit(1)
+	else:
+		parser.error("Either --shot or --jobs is required")
+
+if __name__ == "__main__":
+	main()
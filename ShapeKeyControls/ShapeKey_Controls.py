@@ -24,8 +24,18 @@ bl_info = {
 	"category" : "Object"
 }
 
+import re
 import bpy
+import bmesh
+import json
+import fnmatch
+import struct
+import hashlib
+import numpy as np
+from contextlib import contextmanager
+from mathutils import kdtree
 from bpy.types import Panel, Operator, PropertyGroup
+from bpy_extras.io_utils import ExportHelper, ImportHelper
 
 class Properties(PropertyGroup):
 	bpy.types.Scene.mirror_by_topo = bpy.props.BoolProperty( name="Mirror by Topology",
@@ -36,6 +46,602 @@ class Properties(PropertyGroup):
 								  description="Combine shapekey remove originals",
 								  default = True)
 
+	bpy.types.Scene.multi_object = bpy.props.BoolProperty( name="All Selected",
+								 description="Run shapekey operators on all selected meshes",
+								 default = False )
+
+	bpy.types.Scene.direct_data = bpy.props.BoolProperty( name="Direct Data",
+								 description="Edit shapekey coordinates directly instead of calling operators for every key",
+								 default = True )
+
+# Direct data
+MIRROR_THRESHOLD = 0.00002
+MIRROR_CACHE_SIZE = 8
+mirror_cache = {}
+workspaces = {}
+
+def use_direct_data(context, obj):
+	if not context.scene.direct_data or obj.mode != "OBJECT":
+		return False
+	return obj.data.shape_keys.use_relative
+
+def read_coords(data, out=None):
+	coords = np.empty((len(data), 3), dtype=np.float32) if out is None else out
+	data.foreach_get("co", coords.ravel())
+	return coords
+
+def write_coords(data, coords):
+	data.foreach_set("co", coords.ravel())
+
+def key_influence(key):
+	# Value the key gets when set to 1 (clamped by the slider range)
+	if key.mute:
+		return 0.0
+	return min(max(1.0, key.slider_min), key.slider_max)
+
+def group_weights(obj, name):
+	group = obj.vertex_groups.get(name)
+	if group is None:
+		return None
+	weights = np.zeros(len(obj.data.vertices), dtype=np.float32)
+	for vertex in obj.data.vertices:
+		for elem in vertex.groups:
+			if elem.group == group.index:
+				weights[vertex.index] = elem.weight
+	return weights
+
+class Workspace:
+	# Scratch buffers shared by all meshes with the same vertex count in a batch
+	def __init__(self, count):
+		self.count = count
+		self.buffers = {}
+		self.deltas = {}
+
+	def buffer(self, name):
+		if name not in self.buffers:
+			self.buffers[name] = np.empty((self.count, 3), dtype=np.float32)
+		return self.buffers[name]
+
+def get_workspace(count):
+	if count not in workspaces:
+		workspaces[count] = Workspace(count)
+	return workspaces[count]
+
+# Sparse deltas
+class SparseDelta:
+	# Vertices a key moves away from its relative key, with their offsets
+	def __init__(self, key, indices, offsets, count):
+		self.name = key.name
+		self.relative = key.relative_key.name
+		self.indices = indices
+		self.offsets = offsets
+		self.count = count
+
+	def dense_size(self):
+		return self.count * 3 * 4
+
+	def sparse_size(self):
+		return self.indices.nbytes + self.offsets.nbytes
+
+def sparse_delta(obj, key, tolerance=0.0):
+	# Built once per key in a batch and shared by mirror, merge and analyze
+	workspace = get_workspace(len(obj.data.vertices))
+	cache_key = (obj.data.shape_keys.as_pointer(), key.name, tolerance)
+	if cache_key not in workspace.deltas:
+		coords = read_coords(key.data, workspace.buffer("key"))
+		relative = read_coords(key.relative_key.data, workspace.buffer("relative"))
+		offsets = np.subtract(coords, relative, out=workspace.buffer("delta"))
+		indices = np.flatnonzero(np.abs(offsets).max(axis=1) > tolerance).astype(np.int32)
+		workspace.deltas[cache_key] = SparseDelta(key, indices, offsets[indices], len(coords))
+	return workspace.deltas[cache_key]
+
+def forget_deltas(obj, key):
+	workspace = get_workspace(len(obj.data.vertices))
+	pointer = obj.data.shape_keys.as_pointer()
+	for cache_key in [cache_key for cache_key in workspace.deltas if cache_key[:2] == (pointer, key.name)]:
+		del workspace.deltas[cache_key]
+
+def sparse_weights(obj, name, indices):
+	group = obj.vertex_groups.get(name)
+	if group is None:
+		return None
+	if len(indices) * 4 > len(obj.data.vertices):
+		return group_weights(obj, name)[indices]
+	weights = np.zeros(len(indices), dtype=np.float32)
+	for n, index in enumerate(indices.tolist()):
+		try:
+			weights[n] = group.weight(index)
+		except RuntimeError:
+			pass
+	return weights
+
+def mix_coords(obj, keys):
+	# Same result as 'shape_key_add(from_mix=True)' with only these keys set to 1
+	list_key = obj.data.shape_keys.key_blocks
+	coords = read_coords(list_key[0].data)
+	for key in keys:
+		influence = key_influence(key)
+		if influence == 0.0 or key == list_key[0]:
+			continue
+		delta = sparse_delta(obj, key)
+		weights = sparse_weights(obj, key.vertex_group, delta.indices) if key.vertex_group else None
+		if weights is not None:
+			offsets = delta.offsets * (weights * np.float32(influence))[:, None]
+		else:
+			offsets = delta.offsets * np.float32(influence)
+		coords[delta.indices] += offsets
+	return coords
+
+def read_positions(mesh):
+	positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+	mesh.vertices.foreach_get("co", positions)
+	return positions.reshape(-1, 3)
+
+def read_edges(mesh):
+	edges = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+	mesh.edges.foreach_get("vertices", edges)
+	return edges.reshape(-1, 2)
+
+def mirror_map_position(positions):
+	positions = positions.tolist()
+	tree = kdtree.KDTree(len(positions))
+	for index, co in enumerate(positions):
+		tree.insert(co, index)
+	tree.balance()
+	mirror = np.full(len(positions), -1, dtype=np.int64)
+	for index, (x, y, z) in enumerate(positions):
+		co, found, dist = tree.find((-x, y, z))
+		if found is not None and dist < MIRROR_THRESHOLD:
+			mirror[index] = found
+	return mirror
+
+def mirror_map_operator(obj, use_topology):
+	# Mirror a scratch key holding vertex indices once with 'shape_key_mirror'
+	# and read its swaps back, so the pairing is exactly the operator's
+	list_key = obj.data.shape_keys.key_blocks
+	active = obj.active_shape_key_index
+	count = len(obj.data.vertices)
+	index = np.arange(count)
+	coords = np.empty((count, 3), dtype=np.float32)
+	coords[:, 0] = 1.0
+	coords[:, 1] = index // 4096
+	coords[:, 2] = index % 4096
+	key = obj.shape_key_add(name="Mirror Map", from_mix=False)
+	write_coords(key.data, coords)
+	obj.active_shape_key_index = list_key.find(key.name)
+	try:
+		bpy.ops.object.shape_key_mirror(use_topology=use_topology)
+		read_coords(key.data, coords)
+	finally:
+		obj.shape_key_remove(key)
+		obj.active_shape_key_index = active
+	source = coords[:, 1].astype(np.int64) * 4096 + coords[:, 2].astype(np.int64)
+	return source, coords[:, 0].copy()
+
+class MirrorMap:
+	def __init__(self, permutation):
+		self.permutation = permutation
+		source, sign = permutation
+		# Vertices the operator leaves where they are
+		self.unmatched = int(np.count_nonzero((source == np.arange(len(source))) & (sign > 0)))
+
+def mesh_hash(positions, edges):
+	digest = hashlib.sha1()
+	digest.update(np.int64(len(positions)).tobytes())
+	digest.update(edges.tobytes())
+	digest.update(positions.tobytes())
+	return digest.hexdigest()
+
+def get_mirror_map(obj, use_topology):
+	# Built once per mesh state, shared by every mirror operator and by
+	# objects with the same topology
+	positions = read_positions(obj.data)
+	edges = read_edges(obj.data)
+	cache_key = (mesh_hash(positions, edges), use_topology)
+	mirror_map = mirror_cache.get(cache_key)
+	if mirror_map is None:
+		if use_topology:
+			mirror_map = MirrorMap(mirror_map_operator(obj, True))
+		else:
+			mirror_map = MirrorMap(mirror_permutation(mirror_map_position(positions)))
+		if len(mirror_cache) >= MIRROR_CACHE_SIZE:
+			del mirror_cache[next(iter(mirror_cache))]
+		mirror_cache[cache_key] = mirror_map
+	return mirror_map
+
+def mirror_permutation(mirror):
+	# Replay the swaps of 'shape_key_mirror' on indices, so a key is mirrored in one step
+	count = len(mirror)
+	source = list(range(count))
+	sign = [1.0] * count
+	tag = [False] * count
+	for i1, i2 in enumerate(mirror.tolist()):
+		if i2 == i1:
+			sign[i1] = -sign[i1]
+			tag[i1] = True
+		elif i2 != -1:
+			if not tag[i1] and not tag[i2]:
+				source[i1], source[i2] = source[i2], source[i1]
+				sign[i1], sign[i2] = -sign[i2], -sign[i1]
+			tag[i1] = tag[i2] = True
+	return np.array(source, dtype=np.int64), np.array(sign, dtype=np.float32)
+
+def mirror_coords(coords, permutation):
+	source, sign = permutation
+	coords = coords[source]
+	coords[:, 0] *= sign
+	return coords
+
+def report_unmatched(operator, mirror_map):
+	if mirror_map.unmatched:
+		operator.report({'WARNING'}, "%d vertices have no mirror and were not mirrored" % mirror_map.unmatched)
+
+def mirror_name(name):
+	end = ("L") if name[-1] == ("R") else ("R")
+	return name[:-1] + end
+
+def reorder_keys(obj, names):
+	# Move keys to the bottom in the new order, starting from the first misplaced key
+	list_key = obj.data.shape_keys.key_blocks
+	current = list_key.keys()
+	first = 0
+	while first < len(names) and current[first] == names[first]:
+		first += 1
+	for name in names[first:]:
+		obj.active_shape_key_index = list_key.find(name)
+		bpy.ops.object.shape_key_move(type='BOTTOM')
+
+def remove_keys(obj, keys):
+	# Remove from the bottom up in one pass, without touching the active key
+	list_key = obj.data.shape_keys.key_blocks
+	for key in sorted(keys, key=lambda key: list_key.find(key.name), reverse=True):
+		obj.shape_key_remove(key)
+
+def merge_shape_keys(obj, keys, name, remove_original):
+	list_key = obj.data.shape_keys.key_blocks
+	coords = mix_coords(obj, keys)
+	new_key = obj.shape_key_add(name=name, from_mix=False)
+	write_coords(new_key.data, coords)
+	new_name = new_key.name
+	if remove_original:
+		remove_keys(obj, keys)
+	else:
+		for key in keys:
+			key.name = key.name[:-1]
+	obj.active_shape_key_index = list_key.find(new_name)
+	obj.data.update()
+
+def apply_as_basis(obj, apply_key):
+	# Rebase every key in place on the applied key, then drop the applied key
+	list_key = obj.data.shape_keys.key_blocks
+	basis = list_key[0]
+	relative = apply_key.relative_key
+	offset = read_coords(apply_key.data) - read_coords(relative.data)
+	new_basis = mix_coords(obj, [apply_key])
+	delta = new_basis - read_coords(basis.data)
+	for key in list_key[1:]:
+		if key == apply_key:
+			continue
+		coords = read_coords(key.data)
+		coords += delta
+		# Keys relative to the applied key keep their shape on its relative key
+		if key.relative_key == apply_key:
+			coords -= offset
+			key.relative_key = relative
+		write_coords(key.data, coords)
+	write_coords(basis.data, new_basis)
+	write_coords(obj.data.vertices, new_basis)
+	obj.shape_key_remove(apply_key)
+	obj.data.update()
+
+def mirror_shape_keys(obj, sources, mirror_map):
+	list_key = obj.data.shape_keys.key_blocks
+	order = list_key.keys()
+	names = set(order)
+	permutation = mirror_map.permutation
+	new_key = None
+	for key in sources:
+		new_name = mirror_name(key.name)
+		if new_name in names:
+			continue
+		coords = mirror_coords(mix_coords(obj, [key]), permutation)
+		new_key = obj.shape_key_add(name=new_name, from_mix=False)
+		write_coords(new_key.data, coords)
+		names.add(new_name)
+		# '_R' key goes after '_L' key
+		index = order.index(key.name)
+		order.insert(index + 1 if key.name.endswith("_L") else index, new_name)
+	if new_key is not None:
+		reorder_keys(obj, order)
+		obj.active_shape_key_index = list_key.find(new_key.name)
+		obj.data.update()
+	return new_key
+
+def reset_factor(obj, count, selected, blend, vertex_group):
+	factor = np.full(count, blend, dtype=np.float32)
+	if selected is not None:
+		factor *= selected
+	if vertex_group:
+		weights = group_weights(obj, vertex_group)
+		if weights is not None:
+			factor *= weights
+	return factor
+
+def reset_vertices(obj, selected_only, blend, vertex_group):
+	# Blend the active key toward the basis, same as 'blend_from_shape'
+	list_key = obj.data.shape_keys.key_blocks
+	key = obj.active_shape_key
+	if key == list_key[0]:
+		return
+	count = len(obj.data.vertices)
+	selected = None
+	if selected_only:
+		selected = np.empty(count, dtype=bool)
+		obj.data.vertices.foreach_get("select", selected)
+	factor = reset_factor(obj, count, selected, blend, vertex_group)
+	basis = read_coords(list_key[0].data)
+	coords = read_coords(key.data)
+	coords += (basis - coords) * factor[:, None]
+	write_coords(key.data, coords)
+	obj.data.update()
+
+def reset_edit_vertices(obj, selected_only, blend, vertex_group):
+	# In Edit Mode the active key lives in the edit mesh, so blend it there
+	list_key = obj.data.shape_keys.key_blocks
+	if obj.active_shape_key == list_key[0]:
+		return
+	bm = bmesh.from_edit_mesh(obj.data)
+	layer = bm.verts.layers.shape.get(list_key[0].name)
+	if layer is None:
+		return
+	verts = [vert for vert in bm.verts if vert.select or not selected_only]
+	deform = bm.verts.layers.deform.active
+	group = obj.vertex_groups.get(vertex_group) if vertex_group else None
+	for vert in verts:
+		factor = blend
+		if group is not None and deform is not None:
+			factor *= vert[deform].get(group.index, 0.0)
+		vert.co = vert.co.lerp(vert[layer], factor)
+	bmesh.update_edit_mesh(obj.data)
+
+def analyze_keys(obj, tolerance, snap):
+	# Sparse deltas of all keys, snapping sub-tolerance noise to the relative key
+	list_key = obj.data.shape_keys.key_blocks
+	deltas = []
+	for key in list_key[1:]:
+		delta = sparse_delta(obj, key, tolerance)
+		if snap and key.relative_key != key:
+			exact = sparse_delta(obj, key)
+			if len(exact.indices) > len(delta.indices):
+				coords = read_coords(key.relative_key.data)
+				coords[delta.indices] += delta.offsets
+				write_coords(key.data, coords)
+				forget_deltas(obj, key)
+		deltas.append(delta)
+	if snap:
+		obj.data.update()
+	return deltas
+
+# Rename
+def tagged_name(name, tag):
+	# Name with the ending of the AddEnd buttons
+	if tag == "+":
+		return name[:-1] if name.endswith("+") else name + "+"
+	if name.endswith("_R") or name.endswith("_L"):
+		return name[:-2] + tag
+	return name + tag
+
+def unique_name(name, taken):
+	number = 1
+	while "%s.%03d" % (name, number) in taken:
+		number += 1
+	return "%s.%03d" % (name, number)
+
+def rename_keys(list_key, renames, number=False):
+	# Resolve all names against one index, then rename. Setting 'key.name'
+	# also updates the F-curve and driver paths that use the key.
+	renames = {old: new for old, new in renames.items() if old != new and old in list_key}
+	taken = set(list_key.keys()) - set(renames)
+	owner = {}
+	applied = {}
+	def keep(name):
+		# Key stays as it is, so an earlier rename to its name is dropped
+		taken.add(name)
+		if name in owner:
+			old = owner.pop(name)
+			del applied[old]
+			keep(old)
+	for old, new in renames.items():
+		if new in taken or new in owner:
+			if not number:
+				keep(old)
+				continue
+			new = unique_name(new, taken | set(owner))
+		owner[new] = old
+		applied[old] = new
+	keys = {old: list_key[old] for old in applied}
+	current = set(list_key.keys())
+	staged = []
+	for old, new in applied.items():
+		# Swaps and chains inside the batch go through a temporary name
+		if new in current:
+			keys[old].name = unique_name(new, current | set(owner))
+			staged.append((keys[old], new))
+		else:
+			keys[old].name = new
+	for key, new in staged:
+		key.name = new
+	return applied
+
+# Delta files
+DELTA_MAGIC = b"SKDELTA\0"
+DELTA_VERSION = 1
+DELTA_ALIGN = 16
+DELTA_PRECISION = 0.00001
+
+def position_hashes(positions):
+	# Per vertex hash of the rounded position, to match vertices of another mesh
+	cells = np.round(positions / DELTA_PRECISION).astype(np.int64).view(np.uint64)
+	return (cells[:, 0] * np.uint64(73856093)) ^ (cells[:, 1] * np.uint64(19349663)) ^ (cells[:, 2] * np.uint64(83492791))
+
+def export_deltas(obj, filepath, dtype, store_positions):
+	list_key = obj.data.shape_keys.key_blocks
+	blocks = []
+	entries = []
+	offset = 0
+	def add_block(array):
+		nonlocal offset
+		blocks.append((offset, array))
+		start = offset
+		offset += -(-array.nbytes // DELTA_ALIGN) * DELTA_ALIGN
+		return start
+	header = {"version": DELTA_VERSION, "vertex_count": len(obj.data.vertices), "dtype": dtype, "keys": entries}
+	if store_positions:
+		header["positions"] = add_block(position_hashes(read_positions(obj.data)))
+	for key in list_key[1:]:
+		delta = sparse_delta(obj, key)
+		offsets = delta.offsets
+		scale = 1.0
+		if dtype == 'FLOAT16':
+			offsets = offsets.astype(np.float16)
+		elif dtype == 'QUANTIZED':
+			scale = float(np.abs(offsets).max()) / 32767 if len(offsets) else 1.0
+			scale = scale or 1.0
+			offsets = np.round(offsets / scale).astype(np.int16)
+		entries.append({
+			"name": key.name,
+			"relative": key.relative_key.name,
+			"slider_min": key.slider_min,
+			"slider_max": key.slider_max,
+			"vertex_group": key.vertex_group,
+			"count": len(delta.indices),
+			"scale": scale,
+			"indices": add_block(delta.indices),
+			"offsets": add_block(np.ascontiguousarray(offsets)),
+		})
+	data = json.dumps(header).encode("utf-8")
+	start = -(-(len(DELTA_MAGIC) + 8 + len(data)) // DELTA_ALIGN) * DELTA_ALIGN
+	with open(filepath, "wb") as f:
+		f.write(DELTA_MAGIC)
+		f.write(struct.pack("<II", DELTA_VERSION, len(data)))
+		f.write(data)
+		for block_offset, array in blocks:
+			f.seek(start + block_offset)
+			f.write(array.tobytes())
+		f.truncate(start + offset)
+	return len(entries)
+
+def read_delta_header(filepath):
+	with open(filepath, "rb") as f:
+		if f.read(len(DELTA_MAGIC)) != DELTA_MAGIC:
+			raise ValueError("Not a shapekey delta file")
+		version, size = struct.unpack("<II", f.read(8))
+		if version > DELTA_VERSION:
+			raise ValueError("Unsupported delta file version %d" % version)
+		header = json.loads(f.read(size).decode("utf-8"))
+	start = -(-(len(DELTA_MAGIC) + 8 + size) // DELTA_ALIGN) * DELTA_ALIGN
+	return header, start
+
+def import_deltas(obj, filepath, match):
+	list_key = obj.data.shape_keys.key_blocks
+	count = len(obj.data.vertices)
+	header, start = read_delta_header(filepath)
+	# Arrays are views into the mapped file, nothing is copied before foreach_set
+	mapped = np.memmap(filepath, dtype=np.uint8, mode="r")
+	def block(offset, dtype, size):
+		return mapped[start + offset:].view(dtype)[:size] if size else np.empty(0, dtype)
+	offsets_type = {'FLOAT32': np.float32, 'FLOAT16': np.float16, 'QUANTIZED': np.int16}[header["dtype"]]
+	source_count = header["vertex_count"]
+	# Vertex index in this mesh for every vertex of the file (-1 if missing)
+	if match == 'POSITION':
+		if "positions" not in header:
+			raise ValueError("Delta file has no position hashes")
+		source = block(header["positions"], np.uint64, source_count)
+		target = position_hashes(read_positions(obj.data))
+		order = np.argsort(target)
+		found = order[np.minimum(np.searchsorted(target, source, sorter=order), count - 1)]
+		remap = np.where(target[found] == source, found, -1)
+	elif source_count == count:
+		remap = None
+	else:
+		raise ValueError("Vertex count does not match (%d in file, %d in mesh)" % (source_count, count))
+	names = set(list_key.keys())
+	for entry in header["keys"]:
+		if entry["name"] not in names:
+			obj.shape_key_add(name=entry["name"], from_mix=False)
+			names.add(entry["name"])
+	# Keys are written after their relative key
+	pending = list(header["keys"])
+	done = {list_key[0].name}
+	while pending:
+		ready = [entry for entry in pending if entry["relative"] in done or entry["relative"] not in names or entry["relative"] == entry["name"]]
+		if not ready:
+			ready = pending[:1]
+		for entry in ready:
+			pending.remove(entry)
+			done.add(entry["name"])
+			key = list_key[entry["name"]]
+			relative = list_key.get(entry["relative"], list_key[0])
+			key.relative_key = relative
+			key.slider_max = entry["slider_max"]
+			key.slider_min = entry["slider_min"]
+			key.vertex_group = entry["vertex_group"]
+			indices = block(entry["indices"], np.int32, entry["count"])
+			offsets = block(entry["offsets"], offsets_type, entry["count"] * 3).reshape(-1, 3)
+			if offsets_type != np.float32:
+				offsets = offsets.astype(np.float32) * np.float32(entry["scale"])
+			if remap is not None:
+				indices = remap[indices]
+				offsets = offsets[indices != -1]
+				indices = indices[indices != -1]
+			coords = read_coords(relative.data)
+			coords[indices] += offsets
+			write_coords(key.data, coords)
+			forget_deltas(obj, key)
+	obj.data.update()
+	return len(header["keys"])
+
+# Batch
+@contextmanager
+def object_context(obj):
+	# Point 'bpy.context.object' at obj for the operators called on it
+	if bpy.context.object == obj:
+		yield
+	else:
+		with bpy.context.temp_override(object=obj, active_object=obj):
+			yield
+
+def target_objects(context):
+	obj = context.object
+	if not context.scene.multi_object or not hasattr(context, "temp_override"):
+		return [obj]
+	objects = [obj]
+	meshes = {obj.data}
+	for selected in context.selected_objects:
+		if selected.type == 'MESH' and selected.data not in meshes and selected.data.shape_keys:
+			if len(selected.data.shape_keys.key_blocks) >= 2 and selected.mode == obj.mode:
+				objects.append(selected)
+				meshes.add(selected.data)
+	return objects
+
+class Batch:
+	bl_options = {'REGISTER', 'UNDO'}
+
+	def execute(self, context):
+		summary = []
+		objects = target_objects(context)
+		try:
+			for obj in objects:
+				count = len(obj.data.shape_keys.key_blocks)
+				with object_context(obj):
+					self.run(context)
+				summary.append("%s: %d > %d keys" % (obj.name, count, len(obj.data.shape_keys.key_blocks)))
+		finally:
+			workspaces.clear()
+		if len(objects) > 1:
+			self.report({'INFO'}, ", ".join(summary))
+		return {'FINISHED'}
+
 class PROPERTIES_PT_Panel(Panel):
 	bl_label = "Shape Keys Controls"
 	bl_space_type = "PROPERTIES"
@@ -53,6 +659,10 @@ class PROPERTIES_PT_Panel(Panel):
 	def draw(self, context):
 		layout = self.layout
 
+		row = layout.row()
+		row.prop(context.scene, "multi_object", text='All Selected')
+		row.prop(context.scene, "direct_data", text='Direct Data')
+
 		box = layout.box()
 		row = box.row()
 		row.prop(context.scene, "mirror_by_topo", text='Mirror by Topology')
@@ -82,25 +692,41 @@ class PROPERTIES_PT_Panel(Panel):
 		row.operator("shapekey.addend_l", text="Add  _L")
 		row.operator("shapekey.addend_merge", text="Add  +")
 		row.operator("shapekey.addend_r", text="Add  _R")
+		row.operator("shapekey.rename", text="", icon="SORTALPHA")
 		
+		row = layout.row(align=True)
+		row.label(text="Compact:")
+		row.operator("shapekey.analyze", text='Analyze')
+		row.enabled = False if bpy.context.object.mode != "OBJECT" else True
+
+		row = layout.row(align=True)
+		row.label(text="Deltas:")
+		row.operator("shapekey.export_deltas", text='Export')
+		row.operator("shapekey.import_deltas", text='Import')
+		row.enabled = False if bpy.context.object.mode != "OBJECT" else True
+
 		row = layout.row(align=True)
 		row.label(text="Reset Vertex:")
 		row.operator("shapekey.reset_selected_vertex", text='Selected')
 		row.operator("shapekey.reset_all_vertex", text='All')
 
-class MirrorSelected(Operator):
+class MirrorSelected(Batch, Operator):
 	bl_idname = "shapekey.mirror_selected"
 	bl_label = "Mirror Selected"
 	bl_description = "Mirror selected shape key with the name ending on '_R' or '_L'"
 
-	def execute(self, context):
+	def run(self, context):
 		key = bpy.context.object.active_shape_key
 		key_index = bpy.context.object.active_shape_key_index
 		list_key = bpy.context.object.data.shape_keys.key_blocks
 		if key.name.endswith("_R") or key.name.endswith("_L"):
 			end = ("L") if key.name[-1] == ("R") else ("R")
 			new_name = key.name[:-1] + end
-			if not new_name in list_key:
+			if not new_name in list_key and use_direct_data(context, bpy.context.object):
+				mirror_map = get_mirror_map(bpy.context.object, context.scene.mirror_by_topo)
+				mirror_shape_keys(bpy.context.object, [key], mirror_map)
+				report_unmatched(self, mirror_map)
+			elif not new_name in list_key:
 				bpy.ops.object.shape_key_clear()
 				key.value = 1.0
 				bpy.ops.object.shape_key_add(from_mix=True)
@@ -120,12 +746,18 @@ class MirrorSelected(Operator):
 			self.report({'INFO'}, "Shape key name does not end with '_R' or '_L'")
 		return {'FINISHED'}
 
-class Mirror_LtoR(Operator):
+class Mirror_LtoR(Batch, Operator):
 	bl_idname = "shapekey.mirror_l_to_r"
 	bl_label = "ShapeKey Mirror L to R" 
 	bl_description = "Mirror all shapekeys with the name ending on '_L'"
 
-	def execute(self, context):
+	def run(self, context):
+		if use_direct_data(context, bpy.context.object):
+			list_key = bpy.context.object.data.shape_keys.key_blocks
+			mirror_map = get_mirror_map(bpy.context.object, context.scene.mirror_by_topo)
+			mirror_shape_keys(bpy.context.object, [key for key in list_key if key.name.endswith('_L')], mirror_map)
+			report_unmatched(self, mirror_map)
+			return {'FINISHED'}
 		order = 0
 		list_key = bpy.context.object.data.shape_keys.key_blocks
 		for num, key in enumerate(list_key):
@@ -146,12 +778,18 @@ class Mirror_LtoR(Operator):
 					order += 1
 		return {'FINISHED'}
 
-class Mirror_All(Operator):
+class Mirror_All(Batch, Operator):
 	bl_idname = "shapekey.mirror_all"
 	bl_label = "ShapeKey Mirror All" 
 	bl_description = "Mirror all shapekeys with the name ending on '_R' and '_L'"
 
-	def execute(self, context):
+	def run(self, context):
+		if use_direct_data(context, bpy.context.object):
+			list_key = bpy.context.object.data.shape_keys.key_blocks
+			mirror_map = get_mirror_map(bpy.context.object, context.scene.mirror_by_topo)
+			mirror_shape_keys(bpy.context.object, [key for key in list_key if key.name.endswith('_L') or key.name.endswith('_R')], mirror_map)
+			report_unmatched(self, mirror_map)
+			return {'FINISHED'}
 		order = 0
 		list_key = bpy.context.object.data.shape_keys.key_blocks
 		for num, key in enumerate(list_key):
@@ -175,12 +813,18 @@ class Mirror_All(Operator):
 					order += 1
 		return {'FINISHED'}
 
-class Mirror_RtoL(Operator):
+class Mirror_RtoL(Batch, Operator):
 	bl_idname = "shapekey.mirror_r_to_l"
 	bl_label = "ShapeKey Mirror R to L" 
 	bl_description = "Mirror all shapekeys with the name ending on '_R'"
 	
-	def execute(self, context):
+	def run(self, context):
+		if use_direct_data(context, bpy.context.object):
+			list_key = bpy.context.object.data.shape_keys.key_blocks
+			mirror_map = get_mirror_map(bpy.context.object, context.scene.mirror_by_topo)
+			mirror_shape_keys(bpy.context.object, [key for key in list_key if key.name.endswith('_R')], mirror_map)
+			report_unmatched(self, mirror_map)
+			return {'FINISHED'}
 		order = 0
 		list_key = bpy.context.object.data.shape_keys.key_blocks
 		for num, key in enumerate(list_key):
@@ -203,15 +847,18 @@ class Mirror_RtoL(Operator):
 					order += 1
 		return {'FINISHED'}		
 
-class Merge(Operator):
+class Merge(Batch, Operator):
 	bl_idname = "shapekey.merge"
 	bl_label = "Merge Shapekey" 
 	bl_description = "Combine shapekeys with the name ending on '+'"
 
-	def execute(self, context):          
+	def run(self, context):          
 		list_key = bpy.context.object.data.shape_keys.key_blocks
 		key_united = [x for x in list_key[1:] if x.name.endswith('+')]
-		if len(key_united) >= 2:
+		if len(key_united) >= 2 and use_direct_data(context, bpy.context.object):
+			new_name = "Combined " + ' + '.join(e.name[:-1] for e in key_united)
+			merge_shape_keys(bpy.context.object, key_united, new_name, bpy.context.scene.remove_original)
+		elif len(key_united) >= 2:
 			bpy.ops.object.shape_key_clear()
 			for key in key_united:
 				key.value = 1
@@ -230,14 +877,20 @@ class Merge(Operator):
 			self.report({'INFO'}, "No shape keys with ending on '+' for combine")
 		return {'FINISHED'}
 
-class ApplyBasis(Operator):
+class ApplyBasis(Batch, Operator):
 	bl_idname = "shapekey.apply_basis"
 	bl_label = "Apply as Basis"
 	bl_description = "Apply selected shapekey as base"
 
-	def execute(self, context):            
+	def run(self, context):            
 		list_key = bpy.context.object.data.shape_keys.key_blocks
 		apply_key = bpy.context.object.active_shape_key
+		if use_direct_data(context, bpy.context.object):
+			if apply_key == list_key[0]:
+				self.report({'INFO'}, "Shape key is already the basis")
+			else:
+				apply_as_basis(bpy.context.object, apply_key)
+			return {'FINISHED'}
 		bpy.ops.object.shape_key_clear()
 		apply_key.value = 1
 		bpy.ops.object.shape_key_add(from_mix=True)
@@ -258,85 +911,235 @@ class ApplyBasis(Operator):
 			rename.name = rename.name[:-1]  
 		return {'FINISHED'}
 
-class AddEnd_L(Operator):
-	bl_idname = "shapekey.addend_l"
-	bl_label = "AddEnd _L"
-	bl_description = "Add the ending '_L' to the name"
+class AddEnd:
+	tag = ""
 
-	def execute(self, context):
+	def run(self, context):
 		key = bpy.context.object.active_shape_key
 		list_key = bpy.context.object.data.shape_keys.key_blocks
-		if key.name.endswith("_R") or key.name.endswith("_L"):
-			new_name = key.name[0:-2] + "_L"
-		else:
-			new_name = key.name + "_L"
-		
-		if not new_name in list_key:
-			bpy.context.object.active_shape_key.name = new_name
-		else:
+		new_name = tagged_name(key.name, self.tag)
+		if not rename_keys(list_key, {key.name: new_name}):
 			self.report({'INFO'}, "This name already exists")
-			
 		return {'FINISHED'}
 
-class AddEnd_Merge(Operator):
+class AddEnd_L(AddEnd, Batch, Operator):
+	bl_idname = "shapekey.addend_l"
+	bl_label = "AddEnd _L"
+	bl_description = "Add the ending '_L' to the name"
+	tag = "_L"
+
+class AddEnd_Merge(AddEnd, Batch, Operator):
 	bl_idname = "shapekey.addend_merge"
 	bl_label = "AddEnd Merge"
 	bl_description = "Add the ending '+' to the name for merge"
+	tag = "+"
 
-	def execute(self, context):
-		key = bpy.context.object.active_shape_key
-		list_key = bpy.context.object.data.shape_keys.key_blocks
-		if key.name.endswith("+"):
-			new_name = key.name[0:-1]
-		else:
-			new_name = key.name + "+"
-		
-		if not new_name in list_key:
-			bpy.context.object.active_shape_key.name = new_name
-		else:
-			self.report({'INFO'}, "This name already exists")
-			
-		return {'FINISHED'}	
-
-class AddEnd_R(Operator):
+class AddEnd_R(AddEnd, Batch, Operator):
 	bl_idname = "shapekey.addend_r"
 	bl_label = "AddEnd _R"
 	bl_description = "Add the ending '_R' to the name"
+	tag = "_R"
 
-	def execute(self, context):
-		key = bpy.context.object.active_shape_key
+class RenameKeys(Batch, Operator):
+	bl_idname = "shapekey.rename"
+	bl_label = "Rename Shapekeys"
+	bl_description = "Rename all shapekeys matching a filter in one step"
+
+	mode : bpy.props.EnumProperty( name="Rule",
+					items=(
+						('_L', "Add  _L", "Set the ending '_L'"),
+						('_R', "Add  _R", "Set the ending '_R'"),
+						('+', "Add  +", "Toggle the ending '+' for merge"),
+						('PREFIX', "Prefix", "Add text before the name"),
+						('SUFFIX', "Suffix", "Add text after the name"),
+						('REGEX', "Regex", "Replace a regular expression"),
+					),
+					default='_L' )
+	text : bpy.props.StringProperty( name="Text",
+					description="Prefix, suffix or regex replacement" )
+	pattern : bpy.props.StringProperty( name="Pattern",
+					description="Regular expression to replace" )
+	name_filter : bpy.props.StringProperty( name="Filter",
+					description="Only rename keys matching this wildcard pattern",
+					default="*" )
+	use_range : bpy.props.BoolProperty( name="Use Range",
+					description="Only rename keys in an index range",
+					default = False )
+	range_start : bpy.props.IntProperty( name="From", default = 1, min = 1 )
+	range_end : bpy.props.IntProperty( name="To", default = 1, min = 1 )
+	number : bpy.props.BoolProperty( name="Number Duplicates",
+					description="Add a number to names that already exist instead of skipping them",
+					default = False )
+
+	def invoke(self, context, event):
+		return context.window_manager.invoke_props_dialog(self)
+
+	def new_name(self, name):
+		if self.mode == 'PREFIX':
+			return self.text + name
+		elif self.mode == 'SUFFIX':
+			return name + self.text
+		elif self.mode == 'REGEX':
+			return re.sub(self.pattern, self.text, name)
+		return tagged_name(name, self.mode)
+
+	def run(self, context):
 		list_key = bpy.context.object.data.shape_keys.key_blocks
-		if key.name.endswith("_R") or key.name.endswith("_L"):
-			new_name = key.name[0:-2] + "_R"
-		else:
-			new_name = key.name + "_R"
-		
-		if not new_name in list_key:
-			bpy.context.object.active_shape_key.name = new_name
-		else:
-			self.report({'INFO'}, "This name already exists")
-			
+		keys = list_key[1:]
+		if self.use_range:
+			keys = list_key[self.range_start:self.range_end + 1]
+		keys = [key for key in keys if fnmatch.fnmatchcase(key.name, self.name_filter)]
+		try:
+			renames = {key.name: self.new_name(key.name) for key in keys}
+		except re.error as error:
+			self.report({'ERROR'}, "Invalid pattern: %s" % error)
+			return {'CANCELLED'}
+		renames = {old: new for old, new in renames.items() if new and new != old}
+		applied = rename_keys(list_key, renames, self.number)
+		if len(applied) < len(renames):
+			self.report({'INFO'}, "%d names already exist" % (len(renames) - len(applied)))
+		return {'FINISHED'}
+
+class AnalyzeKeys(Batch, Operator):
+	bl_idname = "shapekey.analyze"
+	bl_label = "Analyze and Compact"
+	bl_description = "Report memory of every shapekey, snap noise to the relative key and flag empty keys"
+
+	tolerance : bpy.props.FloatProperty( name="Tolerance",
+					description="Offsets up to this distance count as unchanged",
+					default = 0.00001, min = 0.0, precision = 6 )
+	snap : bpy.props.BoolProperty( name="Snap Noise",
+					description="Move vertices within the tolerance back to the relative key",
+					default = True )
+	remove_empty : bpy.props.BoolProperty( name="Remove Empty",
+					description="Remove keys that move no vertex",
+					default = False )
+
+	def run(self, context):
+		obj = bpy.context.object
+		list_key = obj.data.shape_keys.key_blocks
+		deltas = analyze_keys(obj, self.tolerance, self.snap)
+		relatives = {key.relative_key.name for key in list_key}
+		dense = sparse = 0
+		empty = []
+		for delta in deltas:
+			dense += delta.dense_size()
+			sparse += delta.sparse_size()
+			self.report({'INFO'}, "%s: %d of %d vertices, %.1f KB dense, %.1f KB sparse" % (
+				delta.name, len(delta.indices), delta.count, delta.dense_size() / 1024, delta.sparse_size() / 1024))
+			if not len(delta.indices) and delta.name not in relatives:
+				empty.append(delta.name)
+		if empty and self.remove_empty:
+			remove_keys(obj, [list_key[name] for name in empty])
+			self.report({'INFO'}, "Removed empty keys: " + ", ".join(empty))
+		elif empty:
+			self.report({'WARNING'}, "Empty keys: " + ", ".join(empty))
+		self.report({'INFO'}, "%s: %.1f KB dense, %.1f KB sparse" % (obj.name, dense / 1024, sparse / 1024))
 		return {'FINISHED'}
 
-class ResetSelectedVertex(Operator):
+class ExportDeltas(Operator, ExportHelper):
+	bl_idname = "shapekey.export_deltas"
+	bl_label = "Export Shapekey Deltas"
+	bl_description = "Write the deltas of all shapekeys to a binary file"
+
+	filename_ext = ".skd"
+	filter_glob : bpy.props.StringProperty( default="*.skd", options={'HIDDEN'} )
+	dtype : bpy.props.EnumProperty( name="Precision",
+					items=(
+						('FLOAT32', "Float32", "Full precision offsets"),
+						('FLOAT16', "Float16", "Half precision offsets"),
+						('QUANTIZED', "Quantized", "16 bit offsets scaled per key"),
+					),
+					default='FLOAT32' )
+	store_positions : bpy.props.BoolProperty( name="Store Position Hash",
+					description="Store vertex positions to import on meshes with another vertex order",
+					default = True )
+
+	def execute(self, context):
+		try:
+			count = export_deltas(bpy.context.object, self.filepath, self.dtype, self.store_positions)
+		except OSError as error:
+			self.report({'ERROR'}, str(error))
+			return {'CANCELLED'}
+		finally:
+			workspaces.clear()
+		self.report({'INFO'}, "Exported %d shapekeys" % count)
+		return {'FINISHED'}
+
+class ImportDeltas(Operator, ImportHelper):
+	bl_idname = "shapekey.import_deltas"
+	bl_label = "Import Shapekey Deltas"
+	bl_description = "Read shapekey deltas from a binary file"
+	bl_options = {'REGISTER', 'UNDO'}
+
+	filename_ext = ".skd"
+	filter_glob : bpy.props.StringProperty( default="*.skd", options={'HIDDEN'} )
+	match : bpy.props.EnumProperty( name="Match",
+					items=(
+						('INDEX', "Index", "Match vertices by index"),
+						('POSITION', "Position", "Match vertices by the stored position hash"),
+					),
+					default='INDEX' )
+
+	def execute(self, context):
+		try:
+			count = import_deltas(bpy.context.object, self.filepath, self.match)
+		except (OSError, ValueError) as error:
+			self.report({'ERROR'}, str(error))
+			return {'CANCELLED'}
+		finally:
+			workspaces.clear()
+		self.report({'INFO'}, "Imported %d shapekeys" % count)
+		return {'FINISHED'}
+
+class Reset:
+	blend : bpy.props.FloatProperty( name="Blend",
+					description="Blend factor toward the basis",
+					default = 1.0, min = 0.0, max = 1.0 )
+	vertex_group : bpy.props.StringProperty( name="Vertex Group",
+					description="Scale the reset by the weights of this vertex group" )
+	recalc_normals : bpy.props.BoolProperty( name="Recalculate Normals",
+					description="Make normals consistent after the reset <Edit Mode>",
+					default = False )
+
+	def draw(self, context):
+		layout = self.layout
+		layout.prop(self, "blend")
+		layout.prop_search(self, "vertex_group", bpy.context.object, "vertex_groups")
+		layout.prop(self, "recalc_normals")
+
+	def reset(self, context, selected_only):
+		obj = bpy.context.object
+		if obj.mode == "OBJECT":
+			reset_vertices(obj, selected_only, self.blend, self.vertex_group)
+		elif obj.mode == "EDIT":
+			reset_edit_vertices(obj, selected_only, self.blend, self.vertex_group)
+			if self.recalc_normals:
+				bpy.ops.mesh.normals_make_consistent(inside=False)
+
+class ResetSelectedVertex(Reset, Batch, Operator):
 	bl_idname = "shapekey.reset_selected_vertex"
 	bl_label = "Reset Selected Vertex"
-	bl_description = "Reset selected vertex in <Edit Mode>"
+	bl_description = "Reset selected vertex to the basis"
 
-	def execute(self, context):
-		if bpy.context.object.mode == "EDIT":
+	def run(self, context):
+		if context.scene.direct_data:
+			self.reset(context, True)
+		elif bpy.context.object.mode == "EDIT":
 			for basis in bpy.context.object.data.shape_keys.key_blocks[:1]:
 				bpy.ops.mesh.blend_from_shape(shape=basis.name, blend=1, add=False)
 				bpy.ops.mesh.normals_make_consistent(inside=False)
 		return {'FINISHED'}
 
-class ResetAllVertex(Operator):
+class ResetAllVertex(Reset, Batch, Operator):
 	bl_idname = "shapekey.reset_all_vertex"
 	bl_label = "Reset All Vertex"
-	bl_description = "Reset all vertex in <Edit Mode>"
+	bl_description = "Reset all vertex to the basis"
 
-	def execute(self, context):
-		if bpy.context.object.mode == "EDIT":
+	def run(self, context):
+		if context.scene.direct_data:
+			self.reset(context, False)
+		elif bpy.context.object.mode == "EDIT":
 			for basis in bpy.context.object.data.shape_keys.key_blocks[:1]:
 				bpy.ops.mesh.select_all(action='DESELECT')
 				bpy.ops.mesh.select_all(action='INVERT')
@@ -353,9 +1156,13 @@ classes = [	PROPERTIES_PT_Panel,
 		Mirror_RtoL,
 		Merge,
 		ApplyBasis,
+		AnalyzeKeys,
+		ExportDeltas,
+		ImportDeltas,
 		AddEnd_L,
 		AddEnd_Merge,
 		AddEnd_R,
+		RenameKeys,
 		ResetSelectedVertex,
 		ResetAllVertex,
 	]
@@ -0,0 +1,266 @@
+# Shape Key Controls benchmark
+# Copyright (C) 2023 VGmove
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Run headless, every case in its own Blender process:
+# blender -b --python shapekey_benchmark.py -- --sizes 10000,100000 --keys 10,100
+#         --output bench.json --reference reference/ [--update-reference]
+#         [--modes direct,legacy --reference-mode legacy]
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import bpy
+
+try:
+	import resource
+except ImportError:
+	resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import ShapeKey_Controls as addon
+
+OPERATORS = {
+	"mirror_all": "mirror_all",
+	"mirror_l_to_r": "mirror_l_to_r",
+	"mirror_r_to_l": "mirror_r_to_l",
+	"merge": "merge",
+	"apply_basis": "apply_basis",
+	"reset_selected": "reset_selected_vertex",
+	"reset_all": "reset_all_vertex",
+}
+# Run in Edit Mode, the only mode the legacy reset works in
+EDIT_OPERATORS = {"reset_selected", "reset_all"}
+
+# Operator call counting
+class CountingModule:
+	def __init__(self, module, name, counts):
+		self.module = module
+		self.name = name
+		self.counts = counts
+
+	def __getattr__(self, name):
+		operator = getattr(self.module, name)
+		def call(*args, **kwargs):
+			key = self.name + "." + name
+			self.counts[key] = self.counts.get(key, 0) + 1
+			return operator(*args, **kwargs)
+		return call
+
+class CountingOps:
+	def __init__(self, counts):
+		self.counts = counts
+
+	def __getattr__(self, name):
+		return CountingModule(getattr(bpy.ops, name), name, self.counts)
+
+class CountingBpy:
+	# Stands in for 'bpy' inside the add-on so nested operator calls are counted
+	def __init__(self, counts):
+		self.ops = CountingOps(counts)
+
+	def __getattr__(self, name):
+		return getattr(bpy, name)
+
+# Synthetic meshes
+def grid_size(vertices):
+	side = max(int(np.sqrt(vertices)), 2)
+	return side + (side % 2 == 0), side
+
+def create_mesh(vertices, key_count, seed):
+	# Grid symmetric in X with a column of vertices on the seam
+	columns, rows = grid_size(vertices)
+	x = np.linspace(-1.0, 1.0, columns, dtype=np.float32)
+	y = np.linspace(-1.0, 1.0, rows, dtype=np.float32)
+	grid_x, grid_y = np.meshgrid(x, y)
+	positions = np.stack((grid_x.ravel(), grid_y.ravel(), np.zeros(grid_x.size, dtype=np.float32)), axis=1)
+	index = np.arange(columns * rows).reshape(rows, columns)
+	faces = np.stack((index[:-1, :-1], index[:-1, 1:], index[1:, 1:], index[1:, :-1]), axis=-1).reshape(-1, 4)
+
+	mesh = bpy.data.meshes.new("Benchmark")
+	mesh.from_pydata(positions.tolist(), [], faces.tolist())
+	obj = bpy.data.objects.new("Benchmark", mesh)
+	bpy.context.scene.collection.objects.link(obj)
+	bpy.context.view_layer.objects.active = obj
+	obj.select_set(True)
+
+	rng = np.random.default_rng(seed)
+	obj.shape_key_add(name="Basis", from_mix=False)
+	left = np.flatnonzero(positions[:, 0] > 0)
+	right = np.flatnonzero(positions[:, 0] < 0)
+	for number in range(key_count):
+		suffix, side = (("_L", left), ("_R", right), ("+", left))[number % 3]
+		key = obj.shape_key_add(name="Key%03d%s" % (number, suffix), from_mix=False)
+		moved = rng.choice(side, size=max(len(side) // 20, 1), replace=False)
+		coords = positions.copy()
+		coords[moved] += rng.normal(scale=0.01, size=(len(moved), 3)).astype(np.float32)
+		key.data.foreach_set("co", coords.ravel())
+	obj.active_shape_key_index = 1
+	selected = np.zeros(len(positions), dtype=bool)
+	selected[left[::2]] = True
+	mesh.vertices.foreach_set("select", selected)
+	return obj
+
+def remove_mesh(obj):
+	mesh = obj.data
+	bpy.data.objects.remove(obj)
+	bpy.data.meshes.remove(mesh)
+
+def snapshot(obj):
+	result = {}
+	for key in obj.data.shape_keys.key_blocks:
+		coords = np.empty(len(key.data) * 3, dtype=np.float32)
+		key.data.foreach_get("co", coords)
+		result[key.name] = coords
+	return result
+
+def compare(result, reference_file):
+	# Bit for bit, including key names and order
+	with np.load(reference_file) as reference:
+		if list(reference["order"]) != list(result):
+			return False
+		for name, coords in result.items():
+			if not np.array_equal(reference["key_" + name].view(np.uint32), coords.view(np.uint32)):
+				return False
+	return True
+
+def save_reference(result, reference_file):
+	arrays = {"key_" + name: coords for name, coords in result.items()}
+	np.savez(reference_file, order=np.array(list(result)), **arrays)
+
+# Each case runs in its own process, so this is the peak of that case
+def peak_rss():
+	if resource is None:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak // 1024 if sys.platform == "darwin" else peak
+
+def run_case(name, vertices, key_count, mode, args):
+	obj = create_mesh(vertices, key_count, args.seed)
+	bpy.context.scene.direct_data = mode == "direct"
+	counts = {}
+	addon.bpy = CountingBpy(counts)
+	operator = getattr(bpy.ops.shapekey, OPERATORS[name])
+	edit = name in EDIT_OPERATORS
+	try:
+		with bpy.context.temp_override(object=obj, active_object=obj, selected_objects=[obj]):
+			if edit:
+				bpy.ops.object.mode_set(mode="EDIT")
+			start = time.perf_counter()
+			operator()
+			seconds = time.perf_counter() - start
+			if edit:
+				bpy.ops.object.mode_set(mode="OBJECT")
+	finally:
+		addon.bpy = bpy
+	result = snapshot(obj)
+	record = {
+		"operator": name,
+		"mode": mode,
+		"object_mode": "EDIT" if edit else "OBJECT",
+		"vertices": len(obj.data.vertices),
+		"keys": key_count,
+		"seconds": seconds,
+		"peak_rss_kb": peak_rss(),
+		"operator_calls": counts,
+		"keys_after": len(result),
+		"match": None,
+	}
+	remove_mesh(obj)
+
+	if args.reference:
+		# '--reference-mode legacy' checks direct data results against the operators
+		reference_mode = args.reference_mode or mode
+		record["reference_mode"] = reference_mode
+		reference_file = os.path.join(args.reference, "%s_%s_%dv_%dk.npz" % (name, reference_mode, vertices, key_count))
+		if args.update_reference and mode == reference_mode:
+			save_reference(result, reference_file)
+		elif os.path.exists(reference_file):
+			record["match"] = compare(result, reference_file)
+	return record
+
+def run_isolated(case, args):
+	# Fresh Blender per case, so timings and peak memory do not carry over
+	handle, output = tempfile.mkstemp(suffix=".json")
+	os.close(handle)
+	command = [bpy.app.binary_path, "-b", "--factory-startup", "--python-exit-code", "1",
+			"--python", os.path.abspath(__file__), "--", "--case", ",".join(map(str, case)),
+			"--output", output, "--seed", str(args.seed)]
+	if args.reference:
+		command += ["--reference", args.reference, "--reference-mode", args.reference_mode]
+	if args.update_reference:
+		command.append("--update-reference")
+	try:
+		returncode = subprocess.call(command)
+		with open(output) as f:
+			record = json.load(f)["results"][0] if returncode == 0 else None
+	finally:
+		os.remove(output)
+	if record is None:
+		name, mode, vertices, key_count = case
+		record = {"operator": name, "mode": mode, "vertices": vertices, "keys": key_count, "seconds": None, "match": False, "returncode": returncode}
+	return record
+
+def main():
+	argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+	parser = argparse.ArgumentParser(description="Benchmark Shape Key Controls operators")
+	parser.add_argument("--sizes", default="10000,100000,1000000", help="Vertex counts")
+	parser.add_argument("--keys", default="10,100,500", help="Shape key counts")
+	parser.add_argument("--operators", default=",".join(OPERATORS), help="Operators to time")
+	parser.add_argument("--modes", default="direct", help="'direct' and/or 'legacy'")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--output", default="bench.json")
+	parser.add_argument("--reference", default="", help="Directory with reference results")
+	parser.add_argument("--update-reference", action="store_true", help="Write reference results instead of comparing")
+	parser.add_argument("--reference-mode", default="", help="Compare every mode against the references of this mode")
+	parser.add_argument("--case", default="", help="Run one 'operator,mode,vertices,keys' case in this process")
+	args = parser.parse_args(argv)
+
+	if args.reference:
+		os.makedirs(args.reference, exist_ok=True)
+	if args.case:
+		try:
+			addon.register()
+		except ValueError:
+			pass
+		name, mode, vertices, key_count = args.case.split(",")
+		with open(args.output, "w") as f:
+			json.dump({"results": [run_case(name, int(vertices), int(key_count), mode, args)]}, f)
+		return
+
+	# The reference mode runs first, so the other modes find its results
+	modes = sorted(args.modes.split(","), key=lambda mode: mode != args.reference_mode)
+	records = []
+	for vertices in [int(size) for size in args.sizes.split(",")]:
+		for key_count in [int(count) for count in args.keys.split(",")]:
+			for name in args.operators.split(","):
+				for mode in modes:
+					record = run_isolated((name, mode, vertices, key_count), args)
+					records.append(record)
+					print("%-15s %-7s %8d verts %4d keys %9.3f s match: %s" % (
+						name, mode, record["vertices"], key_count, record["seconds"] or 0.0, record["match"]))
+
+	with open(args.output, "w") as f:
+		json.dump({"blender": bpy.app.version_string, "results": records}, f, indent=2)
+	if any(record["match"] is False for record in records):
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()